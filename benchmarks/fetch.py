@@ -0,0 +1,135 @@
+'''
+Runs main end to end against a local stand-in for the FDA sites, no network needed.
+The fixtures are served by http.server at the paths main fetches them from, each request can be slowed down by
+--latency to show the downloads running side by side. Three runs are made in a temporary directory:
+a fetch of every book on its own, timed against the sum of its requests' latency, a full run, and a run with
+--skip-unchanged that must only get 304s back and skip every book.
+
+python benchmarks/fetch.py
+python benchmarks/fetch.py --rows 100000 --latency 1 --format csv xlsx
+'''
+
+import os
+import io
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+import functools
+from datetime import datetime
+from collections import Counter
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import main
+from fda_data_getter.fetch import Fetcher, FetchCache, fetch_all
+from fda_data_getter.formats import FORMATS
+from fda_data_getter.orange_book import ORANGE_BOOK_URL
+from fda_data_getter.ndc import NDC_URL
+from fda_data_getter.purple_book import PURPLE_BOOK_URL
+from fixtures import write_fixtures
+
+def routes(fixtures):
+    # the path of each source on the FDA sites and the fixture served there, the biologics extract is this month's
+    month = datetime.utcnow()
+    biologics = f'/files/{month:%Y}/purplebook-search-{month:%B}-data-download.csv'.lower()
+    purple_book = urlsplit(PURPLE_BOOK_URL).path.rstrip('/')
+    return {urlsplit(ORANGE_BOOK_URL).path: os.path.join(fixtures, 'orange_book.zip'),
+            urlsplit(NDC_URL).path: os.path.join(fixtures, 'ndc.zip'),
+            purple_book + biologics: os.path.join(fixtures, 'purple_book_database_extract.csv'),
+            purple_book + '/api/v1/patent-list': os.path.join(fixtures, 'patent_list.json')}
+
+class StandIn(SimpleHTTPRequestHandler):
+    # serves the routes with http.server's Last-Modified and 304 handling, anything else is a 404
+    def __init__(self, *args, routes, latency, statuses, **kwargs):
+        self.routes = routes
+        self.latency = latency
+        self.statuses = statuses
+        super().__init__(*args, **kwargs)
+
+    def translate_path(self, path):
+        # a path that can't be opened is answered with a 404
+        return self.routes.get(urlsplit(path).path, '')
+
+    def send_response(self, code, message=None):
+        self.statuses[int(code)] += 1
+        super().send_response(code, message)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def stand_in(fixtures, latency):
+    statuses = Counter()
+    handler = functools.partial(StandIn, routes=routes(fixtures), latency=latency, statuses=statuses)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}', statuses
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def timed_fetch(base_url, format):
+    # only the fetch stage, every book at once, with a cache of its own so nothing is a 304
+    fetcher = Fetcher(cache=FetchCache('raw_data/fetch_cache.json'))
+    books = main.make_books(main.BOOKS, format, fetcher, 1, False, 'raise', None, base_url=base_url)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetch_all(books)
+    elapsed = time.perf_counter() - start
+    fetcher.close()
+    os.remove('raw_data/fetch_cache.json')
+    return elapsed
+
+def run_main(base_url, formats, skip_unchanged=False):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        main.main(formats, skip_unchanged=skip_unchanged, base_url=base_url)
+    return time.perf_counter() - start, log.getvalue()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run main against a local stand-in for the FDA sites')
+    parser.add_argument('--rows', type=int, default=10000, help='rows in every raw file')
+    parser.add_argument('--format', nargs='+', default=['csv'], choices=FORMATS)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds every request waits before it is answered')
+    parser.add_argument('--fixtures', help='directory of fixtures, generated if it does not exist')
+    args = parser.parse_args()
+    fixtures = args.fixtures or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', str(args.rows))
+    fixtures = os.path.abspath(fixtures) + os.sep
+    if not os.path.exists(fixtures):
+        print(f'writing {args.rows} row fixtures to {fixtures}')
+        write_fixtures(fixtures, args.rows)
+    with tempfile.TemporaryDirectory() as directory, stand_in(fixtures, args.latency) as (base_url, statuses):
+        # output goes next to the working directory, so the runs are made one level down
+        cwd = os.getcwd()
+        os.makedirs(os.path.join(directory, 'run', 'raw_data'))
+        os.chdir(os.path.join(directory, 'run'))
+        try:
+            elapsed = timed_fetch(base_url, args.format)
+            requests = sum(statuses.values())
+            print(f'fetch   {requests} requests in {elapsed:.2f} s, '
+                    f'{requests*args.latency:.2f} s of latency one after the other')
+            statuses.clear()
+            elapsed, log = run_main(base_url, args.format)
+            outputs = glob.glob(os.path.join(glob.escape(directory), '*finished data*'))
+            print(f'run     {dict(statuses)} in {elapsed:.2f} s, {len(outputs)} output files')
+            if 'Done!' not in log or not outputs:
+                sys.exit(f'the run against the stand-in failed:\n{log}')
+            statuses.clear()
+            elapsed, log = run_main(base_url, args.format, skip_unchanged=True)
+            skipped = log.count('is unchanged since it was last processed')
+            print(f'rerun   {dict(statuses)} in {elapsed:.2f} s, {skipped} of {len(main.BOOKS)} books skipped')
+            if set(statuses) != {304} or skipped != len(main.BOOKS):
+                sys.exit(f'the rerun with --skip-unchanged fetched or processed again:\n{log}')
+        finally:
+            os.chdir(cwd)
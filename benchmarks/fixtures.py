@@ -0,0 +1,226 @@
+'''
+Synthetic raw files shaped like the FDA downloads, so transformers can be benchmarked offline.
+Every file gets the same number of rows and is laid out like the real one, with the same names as in raw_data:
+orange_book.zip with the three ~ separated Orange Book files, ndc.zip with the cp1252 tab separated product file,
+the Purple Book extract with its changes section above the break, and the patent list as the API's JSON.
+Values come from a seeded generator so a given size always produces the same files.
+Rows are generated and written a chunk at a time so even the largest sizes need little memory.
+
+python benchmarks/fixtures.py 100000 benchmarks/data/100000/
+'''
+
+import os
+import io
+import sys
+import csv
+import zipfile
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 250000
+
+INGREDIENTS = [f'INGREDIENT {number}' for number in range(1500)] + ['ACETAMINOPHEN; IBUPROFEN', 'ESTRADIOL']
+TRADE_NAMES = [f'Trade Name {number}' for number in range(3000)] + ['ALPHA', 'Beta', 'gamma Drug', 'CAFÉ']
+APPLICANTS = [f'APPLICANT {number}' for number in range(800)]
+# the Orange Book's Applicant is a short form of the company's name, like TEVA PHARMS USA
+APPLICANT_SHORT_NAMES = [f'APPLCNT {number} PHARMS' for number in range(800)]
+DF_ROUTES = ['TABLET;ORAL', 'CAPSULE;ORAL', 'INJECTABLE;INJECTION', 'CREAM;TOPICAL', 'SOLUTION;OPHTHALMIC']
+EXCLUSIVITY_CODES = ['NCE', 'ODE', 'M-14', 'I-775', 'NP', 'PED', 'RTO']
+MARKETING_CATEGORIES = ['NDA', 'ANDA', 'BLA', 'OTC MONOGRAPH FINAL', 'UNAPPROVED HOMEOPATHIC', 'UNAPPROVED DRUG OTHER']
+LABELERS = [f'Labeler {number}, Inc.' for number in range(2000)] + ['Pharmacie Générale']
+PHARM_CLASSES = ['', 'Nonsteroidal Anti-inflammatory Drug [EPC]', 'Cyclooxygenase Inhibitors [MoA]',
+                    'Opioid Agonist [EPC],Opioid Agonists [MoA]']
+
+PURPLE_COLUMNS = ['N/R/U', 'Applicant', 'BLA Number', 'Proprietary Name', 'Proper Name', 'BLA Type', 'Strength',
+                    'Dosage Form', 'Route of Administration', 'Product Presentation', 'Status', 'Licensure',
+                    'Approval Date', 'Ref. Product Proper Name', 'Ref. Product Proprietary Name',
+                    'Supplement Number', 'Submission Type', 'License Number', 'Product Number', 'Center',
+                    'Date of First Licensure', 'Exclusivity Expiration Date',
+                    'First Interchangeable Exclusivity Exp. Date', 'Ref. Product Exclusivity Exp. Date',
+                    'Orphan Exclusivity Exp. Date']
+PATENT_LIST_KEYS = ['id', 'referenceProductBlaNumber', 'applicant', 'proprietaryName', 'properName',
+                    'patentNumber', 'patentExpirationDate', 'createdAt', 'updatedAt']
+
+def pick(rng, values, size):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+
+def blank(rng, values, rate, empty=''):
+    # blanks out roughly rate of values, like the gaps in the real files
+    values = np.asarray(values, dtype=object).copy()
+    values[rng.random(len(values)) < rate] = empty
+    return values
+
+def dates(rng, size, format, start='1950-01-01', days=30000):
+    # drawn from a pool of distinct dates, as in the real files most dates repeat
+    pool = (pd.Timestamp(start) + pd.to_timedelta(np.arange(0, days, 7), unit='D')).strftime(format)
+    return pick(rng, pool, size)
+
+def padded(numbers, width):
+    return pd.Series(numbers).astype(str).str.zfill(width).to_numpy()
+
+def chunks(rows):
+    for start in range(0, rows, CHUNK_ROWS):
+        yield start, min(CHUNK_ROWS, rows - start)
+
+def products(rng, start, size):
+    number = np.arange(start, start + size)
+    approval = dates(rng, size, '%b %d, %Y', start='1982-01-01', days=15000)
+    approval[rng.random(size) < 0.05] = 'Approved Prior to Jan 1, 1982'
+    return pd.DataFrame({'Ingredient': pick(rng, INGREDIENTS, size),
+                        'DF;Route': pick(rng, DF_ROUTES, size),
+                        'Trade_Name': pick(rng, TRADE_NAMES, size),
+                        'Applicant': pick(rng, APPLICANT_SHORT_NAMES, size),
+                        'Strength': pick(rng, ['5MG', '10MG', 'EQ 20MG BASE', '0.1%'], size),
+                        'Appl_Type': pick(rng, ['N', 'A'], size),
+                        'Appl_No': padded(number // 3 + 1, 6),
+                        'Product_No': padded(number % 3 + 1, 3),
+                        'TE_Code': blank(rng, pick(rng, ['AB', 'AB1', 'AP', 'BX'], size), 0.6),
+                        'Approval_Date': approval,
+                        'RLD': pick(rng, ['Yes', 'No'], size),
+                        'RS': pick(rng, ['Yes', 'No'], size),
+                        'Type': pick(rng, ['RX', 'OTC', 'DISCN'], size),
+                        'Applicant_Full_Name': pick(rng, APPLICANTS, size)})
+
+def product_keys(rng, rows, size):
+    # patents and exclusivity only refer to products that exist
+    number = rng.integers(0, rows, size)
+    return padded(number // 3 + 1, 6), padded(number % 3 + 1, 3)
+
+def patents(rng, start, size, rows):
+    appl_no, product_no = product_keys(rng, rows, size)
+    patent_no = pd.Series(rng.integers(4000000, 12000000, size)).astype(str).to_numpy(dtype=object)
+    pediatric = rng.random(size) < 0.05
+    patent_no[pediatric] = patent_no[pediatric] + '*PED'
+    return pd.DataFrame({'Appl_Type': pick(rng, ['N', 'A'], size),
+                        'Appl_No': appl_no,
+                        'Product_No': product_no,
+                        'Patent_No': patent_no,
+                        'Patent_Expire_Date_Text': dates(rng, size, '%b %d, %Y', start='2000-01-01', days=15000),
+                        'Drug_Substance_Flag': blank(rng, np.full(size, 'Y', dtype=object), 0.6),
+                        'Drug_Product_Flag': blank(rng, np.full(size, 'Y', dtype=object), 0.3),
+                        'Patent_Use_Code': blank(rng, 'U-' + pd.Series(rng.integers(1, 4000, size)).astype(str), 0.4),
+                        'Delist_Flag': blank(rng, np.full(size, 'Y', dtype=object), 0.97),
+                        'Submission_Date': blank(rng, dates(rng, size, '%b %d, %Y', start='2005-01-01', days=7000), 0.2)})
+
+def exclusivity(rng, start, size, rows):
+    appl_no, product_no = product_keys(rng, rows, size)
+    return pd.DataFrame({'Appl_Type': pick(rng, ['N', 'A'], size),
+                        'Appl_No': appl_no,
+                        'Product_No': product_no,
+                        'Exclusivity_Code': pick(rng, EXCLUSIVITY_CODES, size),
+                        'Exclusivity_Date': dates(rng, size, '%b %d, %Y', start='2015-01-01', days=6000)})
+
+def ndc_products(rng, start, size):
+    number = np.arange(start, start + size)
+    labeler = padded(number // 1000 % 100000, 5)
+    product_ndc = labeler + '-' + padded(number % 1000, 3)
+    proprietary = pick(rng, TRADE_NAMES, size)
+    return pd.DataFrame({'PRODUCTID': product_ndc + '_' + pd.Series(number).map('{:08x}-0000-4000-8000-000000000000'.format).to_numpy(),
+                        'PRODUCTNDC': product_ndc,
+                        'PRODUCTTYPENAME': pick(rng, ['HUMAN PRESCRIPTION DRUG', 'HUMAN OTC DRUG'], size),
+                        'PROPRIETARYNAME': blank(rng, proprietary, 0.02),
+                        'PROPRIETARYNAMESUFFIX': blank(rng, pick(rng, ['XR', 'PM', 'Extra Strength'], size), 0.9),
+                        'NONPROPRIETARYNAME': blank(rng, pick(rng, INGREDIENTS, size), 0.01),
+                        'DOSAGEFORMNAME': pick(rng, ['TABLET', 'CAPSULE', 'INJECTION, SOLUTION', 'CREAM'], size),
+                        'ROUTENAME': pick(rng, ['ORAL', 'TOPICAL', 'INTRAVENOUS; INTRAMUSCULAR'], size),
+                        'STARTMARKETINGDATE': dates(rng, size, '%Y%m%d', start='1970-01-01', days=20000),
+                        'ENDMARKETINGDATE': blank(rng, dates(rng, size, '%Y%m%d', start='2010-01-01', days=7000), 0.9),
+                        'MARKETINGCATEGORYNAME': pick(rng, MARKETING_CATEGORIES, size),
+                        'APPLICATIONNUMBER': blank(rng, 'ANDA' + padded(rng.integers(0, 220000, size), 6), 0.2),
+                        'LABELERNAME': pick(rng, LABELERS, size),
+                        'SUBSTANCENAME': blank(rng, pick(rng, INGREDIENTS, size), 0.01),
+                        'ACTIVE_NUMERATOR_STRENGTH': pick(rng, ['5', '10', '.5', '325; 200'], size),
+                        'ACTIVE_INGRED_UNIT': pick(rng, ['mg/1', 'mg/mL', 'g/100g'], size),
+                        'PHARM_CLASSES': pick(rng, PHARM_CLASSES, size),
+                        'DEASCHEDULE': blank(rng, pick(rng, ['CII', 'CIV'], size), 0.95),
+                        'NDC_EXCLUDE_FLAG': 'N',
+                        'LISTING_RECORD_CERTIFIED_THROUGH': blank(rng, np.full(size, '20261231', dtype=object), 0.3)})
+
+def biologics(rng, start, size):
+    number = np.arange(start, start + size)
+    def exclusivity_dates():
+        return blank(rng, dates(rng, size, '%m/%d/%Y', start='2010-01-01', days=9000), 0.8)
+    return pd.DataFrame({'N/R/U': blank(rng, pick(rng, ['N', 'R', 'U'], size), 0.7),
+                        'Applicant': pick(rng, APPLICANTS, size),
+                        'BLA Number': (125000 + number // 4).astype(str),
+                        'Proprietary Name': blank(rng, pick(rng, TRADE_NAMES, size), 0.1),
+                        'Proper Name': pick(rng, [name.lower() + '-abcd' for name in INGREDIENTS], size),
+                        'BLA Type': pick(rng, ['351(a)', '351(k) Biosimilar', '351(k) Interchangeable'], size),
+                        'Strength': pick(rng, ['100MG/ML', '40MG/0.8ML'], size),
+                        'Dosage Form': pick(rng, ['Injection', 'For Injection'], size),
+                        'Route of Administration': pick(rng, ['Intravenous', 'Subcutaneous'], size),
+                        'Product Presentation': pick(rng, ['Single-Dose Vial', 'Prefilled Syringe'], size),
+                        'Status': pick(rng, ['Rx', 'Disc'], size),
+                        'Licensure': pick(rng, ['Licensed', 'Revoked'], size),
+                        'Approval Date': dates(rng, size, '%m/%d/%Y', start='1990-01-01', days=12000),
+                        'Ref. Product Proper Name': blank(rng, pick(rng, INGREDIENTS, size), 0.5),
+                        'Ref. Product Proprietary Name': blank(rng, pick(rng, TRADE_NAMES, size), 0.5),
+                        'Supplement Number': blank(rng, rng.integers(1, 5000, size).astype(str), 0.5),
+                        'Submission Type': pick(rng, ['Original', 'Supplement'], size),
+                        'License Number': rng.integers(1, 2200, size).astype(str),
+                        'Product Number': (number % 4 + 1).astype(str),
+                        'Center': pick(rng, ['CDER', 'CBER'], size),
+                        'Date of First Licensure': exclusivity_dates(),
+                        'Exclusivity Expiration Date': exclusivity_dates(),
+                        'First Interchangeable Exclusivity Exp. Date': exclusivity_dates(),
+                        'Ref. Product Exclusivity Exp. Date': exclusivity_dates(),
+                        'Orphan Exclusivity Exp. Date': exclusivity_dates()})
+
+def patent_list(rng, start, size):
+    number = np.arange(start, start + size)
+    return pd.DataFrame({'id': number + 1,
+                        'referenceProductBlaNumber': (125000 + rng.integers(0, 1000, size)).astype(str),
+                        'applicant': pick(rng, APPLICANTS, size),
+                        'proprietaryName': blank(rng, pick(rng, TRADE_NAMES, size), 0.1, None),
+                        'properName': blank(rng, pick(rng, [name.lower() for name in INGREDIENTS], size), 0.1, None),
+                        'patentNumber': pd.Series(rng.integers(5000000, 12000000, size)).map('{:,}'.format).to_numpy(),
+                        'patentExpirationDate': blank(rng, dates(rng, size, '%Y-%m-%d', start='2020-01-01', days=9000), 0.1, None),
+                        'createdAt': '2023-01-01T00:00:00.000Z',
+                        'updatedAt': '2023-01-01T00:00:00.000Z'})
+
+def write_member(archive, name, generate, rows, sep, encoding='utf-8'):
+    with archive.open(name, 'w', force_zip64=True) as member, \
+            io.TextIOWrapper(member, encoding=encoding, newline='') as text:
+        for start, size in chunks(rows):
+            generate(start, size).to_csv(text, sep=sep, index=False, header=start == 0)
+
+def write_purple_book(path, rng, rows):
+    # a title row, the changes of the month, then the full extract after its own title row
+    empty = [''] * (len(PURPLE_COLUMNS) - 1)
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['Purple Book Data Download'] + empty)
+        writer.writerow(['Changes to the Purple Book this month'] + empty)
+        writer.writerow(PURPLE_COLUMNS)
+        biologics(rng, 0, min(rows, 50)).to_csv(csv_file, index=False, header=False)
+        writer.writerow(['Purple Book Database Extract'] + empty)
+        writer.writerow(PURPLE_COLUMNS)
+        for start, size in chunks(rows):
+            biologics(rng, start, size).to_csv(csv_file, index=False, header=False)
+
+def write_patent_list(path, rng, rows):
+    # the JSON the API returns
+    with open(path, 'w') as json_file:
+        json_file.write('[')
+        for start, size in chunks(rows):
+            data = patent_list(rng, start, size)
+            json_file.write((',' if start else '') + data.to_json(orient='records')[1:-1])
+        json_file.write(']')
+
+def write_fixtures(path, rows, seed=0):
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(os.path.join(path, 'orange_book.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        write_member(archive, 'products.txt', lambda start, size: products(rng, start, size), rows, '~')
+        write_member(archive, 'patent.txt', lambda start, size: patents(rng, start, size, rows), rows, '~')
+        write_member(archive, 'exclusivity.txt', lambda start, size: exclusivity(rng, start, size, rows), rows, '~')
+    with zipfile.ZipFile(os.path.join(path, 'ndc.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        write_member(archive, 'product.xls', lambda start, size: ndc_products(rng, start, size), rows, '\t', 'cp1252')
+    write_purple_book(os.path.join(path, 'purple_book_database_extract.csv'), rng, rows)
+    write_patent_list(os.path.join(path, 'patent_list.json'), rng, rows)
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    path = sys.argv[2] if len(sys.argv) > 2 else f'benchmarks/data/{rows}/'
+    write_fixtures(path, rows)
+    print(f'{rows} row fixtures written to {path}')
@@ -0,0 +1,51 @@
+'''
+Reports how much memory each transformer's frames hold with and without categorical columns.
+For every transformer the source is extracted and transformed twice, once with its categories
+read as plain strings (before) and once as categoricals (after), and the deep memory of the
+raw and the transformed frame is printed for both. Uses the same fixtures as transformers.py.
+
+python benchmarks/memory.py
+python benchmarks/memory.py --rows 1000000 --only NDC OBPat
+'''
+
+import os
+import sys
+import io
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fixtures import write_fixtures
+from transformers import TRANSFORMERS, transformer
+
+def frame_mb(data):
+    return data.memory_usage(index=True, deep=True).sum() / 2**20
+
+def footprint(name, fixtures, format, categorical):
+    with contextlib.redirect_stdout(io.StringIO()):
+        etl = transformer(name, fixtures, format)
+        if not categorical:
+            etl.categories = ()
+        etl.data = etl._extract()
+        raw = frame_mb(etl.data)
+        etl._transform()
+    return raw, frame_mb(etl.data)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='memory held by the transformer frames with and without categoricals')
+    parser.add_argument('--rows', type=int, default=100000, help='rows in every raw file')
+    parser.add_argument('--format', default='csv')
+    parser.add_argument('--only', nargs='+', choices=TRANSFORMERS, default=TRANSFORMERS)
+    parser.add_argument('--fixtures', help='directory of fixtures, generated if it does not exist')
+    args = parser.parse_args()
+    fixtures = args.fixtures or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', str(args.rows))
+    fixtures = os.path.abspath(fixtures) + os.sep
+    if not os.path.exists(fixtures):
+        print(f'writing {args.rows} row fixtures to {fixtures}')
+        write_fixtures(fixtures, args.rows)
+    print(f'{"":7s} {"raw before":>11s} {"raw after":>10s} {"out before":>11s} {"out after":>10s}')
+    for name in args.only:
+        raw_before, out_before = footprint(name, fixtures, args.format, False)
+        raw_after, out_after = footprint(name, fixtures, args.format, True)
+        print(f'{name:7s} {raw_before:8.1f} MB {raw_after:7.1f} MB {out_before:8.1f} MB {out_after:7.1f} MB'
+                f'  ({1 - (raw_after + out_after) / (raw_before + out_before):.0%} less)')
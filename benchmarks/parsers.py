@@ -0,0 +1,93 @@
+'''
+Checks that the pandas and arrow parsers give every transformer the same source frame and the same output,
+on synthetic fixtures, no network needed. Chunked sources are compared chunk by chunk.
+Each transformer is run end to end once per parser in a temporary directory and its output files are compared
+byte for byte, so the format should be one whose files don't carry a timestamp, like csv.
+Exits with an error when anything differs.
+
+python benchmarks/parsers.py
+python benchmarks/parsers.py --rows 100000 --only NDC OBProd
+'''
+
+import os
+import io
+import sys
+import glob
+import argparse
+import tempfile
+import contextlib
+import filecmp
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fda_data_getter.parsers import PARSERS, arrow_available
+from fixtures import write_fixtures
+from transformers import TRANSFORMERS, transformer
+
+def extract(name, fixtures, parser):
+    # the source frames as etl would read them, a list of chunks for chunked transformers
+    with contextlib.redirect_stdout(io.StringIO()):
+        etl = transformer(name, fixtures, 'csv')
+        etl.parser = parser
+        etl.parse_cache_path = None
+        if etl.chunksize is None:
+            return [etl._extract()]
+        return list(etl._extract_chunks(etl.source_dtypes(etl._chunk_dtypes())))
+
+def outputs(name, fixtures, format, parser, directory):
+    # the output files of an etl run, by name, written one level below directory as they go next to the working one
+    with contextlib.redirect_stdout(io.StringIO()):
+        etl = transformer(name, fixtures, format)
+    etl.parser = parser
+    etl.parse_cache_path = None
+    run = os.path.join(directory, parser, 'run')
+    os.makedirs(run)
+    cwd = os.getcwd()
+    os.chdir(run)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            etl.etl(name)
+    finally:
+        os.chdir(cwd)
+    written = glob.glob(os.path.join(glob.escape(os.path.join(directory, parser)), '*'))
+    return {os.path.basename(path)[len('run'):]: path for path in written if os.path.isfile(path)}
+
+def same_frames(first, second):
+    if len(first) != len(second):
+        return False
+    try:
+        for chunk, other in zip(first, second):
+            pd.testing.assert_frame_equal(chunk, other)
+    except AssertionError:
+        return False
+    return True
+
+def same_outputs(first, second):
+    return first.keys() == second.keys() and all(filecmp.cmp(first[name], second[name], shallow=False) for name in first)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='check the pandas and arrow parsers give the same frames and output')
+    parser.add_argument('--rows', type=int, default=10000, help='rows in every raw file')
+    parser.add_argument('--format', default='csv', help='output format compared')
+    parser.add_argument('--only', nargs='+', choices=TRANSFORMERS, default=TRANSFORMERS)
+    parser.add_argument('--fixtures', help='directory of fixtures, generated if it does not exist')
+    args = parser.parse_args()
+    if not arrow_available():
+        sys.exit('the arrow parser needs pyarrow, try \'pip install pyarrow\'')
+    fixtures = args.fixtures or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', str(args.rows))
+    fixtures = os.path.abspath(fixtures) + os.sep
+    if not os.path.exists(fixtures):
+        print(f'writing {args.rows} row fixtures to {fixtures}')
+        write_fixtures(fixtures, args.rows)
+    different = []
+    for name in args.only:
+        frames = [extract(name, fixtures, backend) for backend in PARSERS]
+        with tempfile.TemporaryDirectory() as directory:
+            files = [outputs(name, fixtures, args.format, backend, directory) for backend in PARSERS]
+            same = same_frames(*frames), same_outputs(*files)
+        print(f'{name:7s} {len(frames[0]):>3} frames {"same" if same[0] else "DIFFERENT"}, '
+                f'{len(files[0])} output files {"same" if same[1] else "DIFFERENT"}')
+        if not all(same):
+            different.append(name)
+    if different:
+        sys.exit(f'the parsers disagree on {", ".join(different)}')
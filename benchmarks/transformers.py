@@ -0,0 +1,103 @@
+'''
+Times every transformer end to end (extract, transform and load) on synthetic fixtures, no network needed.
+Fixtures are generated by fixtures.py on first use and kept in benchmarks/data/<rows>/.
+Each transformer runs in a fresh process so its peak memory is its own. Exclusivity and patents
+get their product index from an untimed products run in the same process, the memory figure is
+how far the etl pushed peak memory above what that setup already reached.
+--json writes the results, stage timings included, for comparing runs.
+
+python benchmarks/transformers.py
+python benchmarks/transformers.py --rows 1000000 --format xlsx --only NDC OBPat --json results.json
+python benchmarks/transformers.py --parser pandas
+'''
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fda_data_getter.orange_book import Product, Exclusivity, Patent
+from fda_data_getter.ndc import NDC
+from fda_data_getter.purple_book import BiologicalDrugs, PurplePatents
+from fda_data_getter.transformer import FORMATS
+from fda_data_getter.parsers import PARSERS
+from fixtures import write_fixtures
+from xlsx_writers import peak_memory
+
+TRANSFORMERS = ('OBProd', 'OBExcl', 'OBPat', 'NDC', 'PB', 'PBPat')
+
+def entity_keys(fixtures, format):
+    products = Product('products.txt', fixtures, format, archive=os.path.join(fixtures, 'orange_book.zip'))
+    products.data = products._extract()
+    products._transform()
+    return products.entity_keys()
+
+def transformer(name, fixtures, format):
+    orange_book = os.path.join(fixtures, 'orange_book.zip')
+    if name == 'OBProd':
+        return Product('products.txt', fixtures, format, archive=orange_book)
+    if name == 'OBExcl':
+        return Exclusivity('exclusivity.txt', entity_keys(fixtures, format), fixtures, format, archive=orange_book)
+    if name == 'OBPat':
+        return Patent('patent.txt', entity_keys(fixtures, format), fixtures, format, archive=orange_book)
+    if name == 'NDC':
+        return NDC('product.xls', fixtures, format, archive=os.path.join(fixtures, 'ndc.zip'))
+    if name == 'PB':
+        return BiologicalDrugs('purple_book_database_extract.csv', fixtures, format)
+    return PurplePatents('patent_list.json', fixtures, format)
+
+def run_transformer(name, fixtures, format, parser='arrow'):
+    with contextlib.redirect_stdout(io.StringIO()):
+        etl = transformer(name, fixtures, format)
+    etl.end_data = os.sep
+    etl.parser = parser
+    # time the parsing, not a load from the parse cache
+    etl.parse_cache_path = None
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        before = peak_memory()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                etl.etl(name)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    stages = sorted(etl.profiler.stages.values(), key=lambda stage: -stage['wall'])
+    # rows written, summed over the chunks of a chunked transformer
+    rows = etl.profiler.stages['load']['rows']
+    return {'transformer': name, 'rows': rows, 'seconds': elapsed,
+            'peak_memory_mb': peak_memory() - before, 'stages': stages}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the transformers on synthetic FDA-shaped data')
+    parser.add_argument('--rows', type=int, default=10000, help='rows in every raw file')
+    parser.add_argument('--format', default='csv', choices=FORMATS)
+    parser.add_argument('--only', nargs='+', choices=TRANSFORMERS, default=TRANSFORMERS)
+    parser.add_argument('--parser', default='arrow', choices=PARSERS, help='backend that parses the raw files')
+    parser.add_argument('--fixtures', help='directory of fixtures, generated if it does not exist')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+    fixtures = args.fixtures or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', str(args.rows))
+    fixtures = os.path.abspath(fixtures) + os.sep
+    if not os.path.exists(fixtures):
+        print(f'writing {args.rows} row fixtures to {fixtures}')
+        write_fixtures(fixtures, args.rows)
+    results = []
+    for name in args.only:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_transformer, name, fixtures, args.format, args.parser).result()
+        results.append(result)
+        slowest = ', '.join(f'{stage["stage"]} {stage["wall"]:.2f} s' for stage in result['stages'][:3])
+        print(f'{name:7s} {result["rows"]:>9} rows  {result["seconds"]:7.2f} s  '
+                f'{result["rows"]/result["seconds"]:>9.0f} rows/s  peak memory +{result["peak_memory_mb"]} MB  ({slowest})')
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'rows': args.rows, 'format': args.format, 'parser': args.parser, 'results': results}, json_file, indent=1)
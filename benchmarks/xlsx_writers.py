@@ -0,0 +1,61 @@
+'''
+Compares the streaming xlsx writer with DataFrame.to_excel on the NDC product file.
+Each writer runs in a fresh process so peak memory is measured separately. The memory figure
+is how far writing pushed peak memory above the peak already reached by extract and transform.
+
+python benchmarks/xlsx_writers.py                      (uses raw_data/ndc.zip from the last run)
+python benchmarks/xlsx_writers.py path/to/product.txt
+'''
+
+import os
+import sys
+import io
+import time
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fda_data_getter.ndc import NDC
+
+def peak_memory():
+    # peak resident memory in MB, resource is not available on windows
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+def ndc_transformer(path):
+    if path.endswith('.zip'):
+        return NDC('product.xls', format='xlsx', archive=path)
+    return NDC(os.path.basename(path), os.path.dirname(path)+'/', format='xlsx')
+
+def run_writer(path, writer):
+    ndc = ndc_transformer(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ndc.data = ndc._extract()
+        ndc._transform()
+    ndc.xlsx_writer = writer
+    ndc.end_data = '/'
+    with tempfile.TemporaryDirectory() as directory:
+        before = peak_memory()
+        start = time.perf_counter()
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                ndc._load('NDC')
+            elapsed = time.perf_counter() - start
+            size = sum(os.path.getsize(name) for name in os.listdir('.'))
+        finally:
+            os.chdir(cwd)
+        after = peak_memory()
+    return len(ndc.data), elapsed, after - before, size
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'raw_data/ndc.zip'
+    for writer in ('openpyxl', 'streaming'):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            rows, elapsed, memory, size = pool.submit(run_writer, path, writer).result()
+        print(f'{writer:10s} {rows} rows  {elapsed:7.2f} s  peak memory +{memory} MB  {size/2**20:.1f} MB file')
@@ -0,0 +1,93 @@
+'''
+Plans the _transform_ methods of a Transformer from the columns they declare with @transform.
+A transform that writes a column it does not read produces it, and everything reading that column runs after it.
+A transform that reads and writes the same column rewrites it in place: it has the last word on the column,
+so every other reader sees the value from before the rewrite and runs first.
+Only transforms that lead to final_columns are run, and transforms in the same level of the plan
+don't depend on each other, so they can run at the same time.
+Filters drop rows rather than make columns, they run first and may only read source columns.
+Transforms declared per_format make columns that depend on the output format, like the Text_ dates.
+They are planned apart and run once per output format after the rest, so nothing may read what they make
+and what they read must not be rewritten by the rest.
+'''
+
+def transform(inputs=(), outputs=(), filters=False, per_format=False):
+    # declares the columns a _transform_ method reads and the columns it returns, or that it returns a row mask
+    def declare(method):
+        method.inputs = tuple(inputs)
+        method.outputs = tuple(outputs)
+        method.filters = filters
+        method.per_format = per_format
+        return method
+    return declare
+
+def writers(transformations):
+    producers = dict()
+    rewriters = dict()
+    for transformation in transformations:
+        for col in transformation.outputs:
+            table = rewriters if col in transformation.inputs else producers
+            if col in table:
+                raise ValueError(f'{col} is written by both {table[col].__name__} and {transformation.__name__}')
+            table[col] = transformation
+    return producers, rewriters
+
+def needed(final_columns, producers, rewriters):
+    # walks back from final_columns, a final column needs its last writer, an input only needs its producer
+    names = set()
+    columns = [(col, True) for col in final_columns]
+    while columns:
+        col, final = columns.pop()
+        writer = rewriters.get(col) if final and col in rewriters else producers.get(col)
+        if writer is not None and writer.__name__ not in names:
+            names.add(writer.__name__)
+            columns.extend((input_col, False) for input_col in writer.inputs)
+    return names
+
+def check_per_format(steps, producers, rewriters):
+    for step in steps:
+        if not step.per_format:
+            continue
+        for other in steps:
+            made = [col for col in other.inputs if producers.get(col) is step]
+            if made:
+                raise ValueError(f'{other.__name__} reads {made[0]} which {step.__name__} makes per output format')
+        rewritten = [col for col in step.inputs if col in rewriters and not rewriters[col].per_format]
+        if rewritten:
+            raise ValueError(f'{step.__name__} runs per output format but reads {rewritten[0]} '
+                                f'which {rewriters[rewritten[0]].__name__} rewrites')
+
+def plan(transformations, final_columns):
+    # returns the filters, the levels to run in order, the levels to run once per output format
+    # and the transforms nothing in final_columns needs
+    for transformation in transformations:
+        if not hasattr(transformation, 'inputs'):
+            raise TypeError(f'{transformation.__name__} has no @transform declaration')
+    filters = [transformation for transformation in transformations if transformation.filters]
+    steps = [transformation for transformation in transformations if not transformation.filters]
+    producers, rewriters = writers(steps)
+    names = needed(final_columns, producers, rewriters)
+    skipped = [step for step in steps if step.__name__ not in names]
+    steps = sorted((step for step in steps if step.__name__ in names), key=lambda step: step.__name__)
+    check_per_format(steps, producers, rewriters)
+    before = {step.__name__: set() for step in steps}
+    for step in steps:
+        for col in step.inputs:
+            producer = producers.get(col)
+            if producer is not None and producer.__name__ != step.__name__:
+                before[step.__name__].add(producer.__name__)
+            rewriter = rewriters.get(col)
+            if rewriter is not None and rewriter.__name__ != step.__name__ and rewriter.__name__ in names:
+                before[rewriter.__name__].add(step.__name__)
+    levels = []
+    done = set()
+    while steps:
+        level = [step for step in steps if before[step.__name__] <= done]
+        if not level:
+            raise ValueError(f'transforms depend on each other in a cycle: {", ".join(step.__name__ for step in steps)}')
+        levels.append(level)
+        done.update(step.__name__ for step in level)
+        steps = [step for step in steps if step.__name__ not in done]
+    shared = [[step for step in level if not step.per_format] for level in levels]
+    per_format = [[step for step in level if step.per_format] for level in levels]
+    return filters, [level for level in shared if level], [level for level in per_format if level], skipped
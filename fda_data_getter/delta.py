@@ -0,0 +1,44 @@
+'''
+Key-based diffs between two extracts of the same source, used by incremental runs.
+Rows are grouped by the transformer's natural keys and each group is compared by a hash of its rows,
+so several rows sharing a key (a patent listed with more than one use code) change together.
+'''
+
+import json
+import pandas as pd
+
+def key_index(data, keys):
+    if len(keys) == 1:
+        return pd.Index(data[keys[0]])
+    return pd.MultiIndex.from_frame(data[keys])
+
+def key_hashes(data, keys):
+    hashes = pd.util.hash_pandas_object(data, index=False).set_axis(key_index(data, keys))
+    levels = list(range(len(keys)))
+    return hashes.groupby(level=levels, dropna=False, sort=False).agg(['sum', 'count'])
+
+def diff(data, previous, keys):
+    new = key_hashes(data, keys)
+    old = key_hashes(previous, keys)
+    added = new.index.difference(old.index, sort=False)
+    removed = old.index.difference(new.index, sort=False)
+    common = new.index.intersection(old.index, sort=False)
+    changed = common[(new.loc[common] != old.loc[common]).any(axis=1).to_numpy()]
+    return added, changed, removed
+
+def occurrences(data, keys):
+    # a row's key and how many rows with the same key came before it
+    frame = data[keys].copy()
+    frame['occurrence'] = frame.groupby(keys, dropna=False, sort=False).cumcount()
+    return pd.MultiIndex.from_frame(frame)
+
+def moved_positions(rows, previous, data, keys):
+    # rows of unchanged keys are indexed by their position in previous, find where they are in data
+    positions = pd.Series(range(len(data)), index=occurrences(data, keys))
+    return positions.reindex(occurrences(previous, keys)[rows.index]).to_numpy()
+
+def write_report(path, added, changed, removed, unchanged):
+    report = {'added': len(added), 'changed': len(changed), 'removed': len(removed), 'unchanged': unchanged,
+                'keys': {'added': added.tolist(), 'changed': changed.tolist(), 'removed': removed.tolist()}}
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=1, default=str)
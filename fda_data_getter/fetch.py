@@ -0,0 +1,144 @@
+'''
+Shared HTTP fetching for the books.
+All downloads go through one keep-alive requests.Session with retries and a default timeout,
+and fetch_all downloads every book at once so a run only waits for the slowest source.
+With a FetchCache attached, requests are conditional on the validators from the last run
+and a source whose content hash is the one its book last processed is reported as unchanged.
+'''
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+class FetchCache():
+    def __init__(self, path='raw_data/fetch_cache.json'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = dict()
+        if os.path.exists(path):
+            with open(path) as cache_file:
+                self.entries = json.load(cache_file)
+
+    def validators(self, url, path):
+        # only ask for a 304 when the copy it would vouch for is still on disk
+        entry = self.entries.get(url)
+        if entry is None or not os.path.exists(path):
+            return dict()
+        headers = dict()
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record(self, url, response, sha256):
+        # the hash processed last is kept until the book is processed again
+        with self.lock:
+            processed = self.entries.get(url, dict()).get('processed')
+            self.entries[url] = {'etag': response.headers.get('ETag'),
+                                'last_modified': response.headers.get('Last-Modified'),
+                                'sha256': sha256,
+                                'fetched': datetime.utcnow().isoformat(),
+                                'processed': processed}
+            self._save()
+
+    def changed(self, url):
+        # a download counts as changed until a book has processed it, so a failed run doesn't skip it next time
+        entry = self.entries.get(url, dict())
+        return entry.get('sha256') is None or entry.get('processed') != entry['sha256']
+
+    def mark_processed(self, urls):
+        # urls are a book's urls, the files it was fetched from, marked once the book processed them successfully
+        with self.lock:
+            for url in urls:
+                if url in self.entries:
+                    self.entries[url]['processed'] = self.entries[url]['sha256']
+            self._save()
+
+    def __getstate__(self):
+        # locks can't be pickled, books carrying a cache are sent to worker processes
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _save(self):
+        temp_path = self.path + '.part'
+        with open(temp_path, 'w') as cache_file:
+            json.dump(self.entries, cache_file, indent=1)
+        os.replace(temp_path, self.path)
+
+class Fetcher():
+    def __init__(self, retries=3, timeout=60, backoff_factor=0.5, pool_size=10, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=('GET', 'HEAD'))
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, path=None, **kwargs):
+        # with a path the request is conditional and may come back 304 Not Modified
+        kwargs.setdefault('timeout', self.timeout)
+        if path is not None and self.cache is not None:
+            kwargs['headers'] = {**self.cache.validators(url, path), **kwargs.get('headers', dict())}
+        return self.session.get(url, **kwargs)
+
+    def peek(self, url, size=64):
+        # the status and first size bytes of url, asked for as a range and streamed so that a server
+        # ignoring the range still only sends what is read before the connection is dropped
+        headers = {'Range': f'bytes=0-{size-1}'}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            start = b''
+            for chunk in response.iter_content(chunk_size=size):
+                start += chunk
+                if len(start) >= size:
+                    break
+            return response.status_code, start[:size]
+
+    def download(self, url, path, chunk_size=1024*1024):
+        # stream to a temp file so the body is never held in memory and a failed download leaves no partial file
+        # returns False when path already holds the version that was last processed
+        temp_path = path + '.part'
+        sha256 = hashlib.sha256()
+        with self.get(url, path, stream=True) as response:
+            if response.status_code == 304:
+                return self.cache.changed(url)
+            response.raise_for_status()
+            with open(temp_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    sha256.update(chunk)
+                    file.write(chunk)
+        os.replace(temp_path, path)
+        if self.cache is None:
+            return True
+        self.cache.record(url, response, sha256.hexdigest())
+        return self.cache.changed(url)
+
+    def close(self):
+        self.session.close()
+
+def rebase(url, base_url=None):
+    # url's path on base_url, so a local server laid out like the FDA sites can stand in for them
+    if base_url is None:
+        return url
+    return base_url.rstrip('/') + urlsplit(url).path
+
+def fetch_all(books, max_workers=None):
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(books), 1)) as pool:
+        futures = [pool.submit(book.fetch) for book in books]
+        for future in futures:
+            future.result()
@@ -0,0 +1,9 @@
+'''
+The output formats and unmatched row policies, kept apart from the transformers so the command line can check
+its arguments without importing pandas.
+'''
+
+FORMATS = ('xlsx', 'csv', 'parquet', 'feather', 'sqlite')
+# formats that keep column types, dates are written as dates rather than text
+COLUMNAR_FORMATS = ('parquet', 'feather')
+UNMATCHED_POLICIES = ('raise', 'drop', 'blank')
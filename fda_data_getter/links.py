@@ -0,0 +1,104 @@
+'''
+Cross-book links on application numbers.
+NDC gives its application as one code (NDA020702, ANDA076543, BLA125057), the Orange Book as Appl_Type and Appl_No
+and the Purple Book as a BLA Number. Each is normalized to the NDC form with a six digit number, so the same
+application has the same Application in every book.
+Every book saves the application, product and name of its rows when it is loaded, and once the books finish
+the Links table is made from them in one pass: a row per book row, indexed on its Application.
+'''
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+from .transformer import Transformer
+
+# Orange Book Appl_Type: application kind
+APPLICATION_KINDS = {'N': 'NDA', 'A': 'ANDA'}
+LINK_COLUMNS = ['Application', 'Application Number', 'Book', 'Product', 'Name']
+
+def application(kind, number):
+    # kind and number are columns or a constant kind, numbers that aren't whole numbers give no application
+    number = pd.to_numeric(pd.Series(number), errors='coerce')
+    valid = number.notna() & (number % 1 == 0)
+    if not isinstance(kind, str):
+        kind = pd.Series(kind, index=number.index).astype(object)
+        valid &= kind.notna()
+    padded = number[valid].astype('int64').astype(str).str.zfill(6)
+    kind = kind if isinstance(kind, str) else kind[valid].astype(str)
+    return (kind + padded).reindex(number.index)
+
+def parse_application(values):
+    # codes like NDA020702 or 'bla 125057' to their Application, anything else (OTC monographs, unapproved drugs) to NaN.
+    # Products share their application's code, so each distinct code is parsed once
+    codes, uniques = pd.factorize(pd.Series(values).astype(object))
+    parts = pd.Series(uniques, dtype=object).str.upper().str.extract(r'^\s*(NDA|ANDA|BLA)\s*(\d+)\s*$')
+    parsed = pd.concat([application(parts[0], parts[1]), pd.Series([np.nan], dtype=object)], ignore_index=True)
+    return pd.Series(parsed.to_numpy()[codes], index=pd.Series(values).index)
+
+def text(values):
+    # every book's products and names as strings, missing ones stay missing
+    values = pd.Series(values)
+    return values.astype(str).astype(object).where(values.notna()).to_numpy()
+
+def link_frame(applications, book, products, names):
+    # rows of a book's link file, rows without an application are left out
+    frame = pd.DataFrame({'Application': applications.to_numpy(), 'Book': book,
+                            'Product': text(products), 'Name': text(names)})
+    frame = frame[frame['Application'].notna()]
+    frame.insert(1, 'Application Number', frame['Application'].str.lstrip('ABDLN').astype('int64'))
+    return frame.reset_index(drop=True)
+
+def load_links(links_path=None):
+    # the link rows every book saved, in book order
+    links_path = links_path or Transformer.links_path
+    frames = [pd.read_pickle(filename) for filename in sorted(glob.glob(os.path.join(glob.escape(links_path), '*.pkl')))]
+    if not frames:
+        return pd.DataFrame(columns=LINK_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[LINK_COLUMNS]
+
+def link_table(links_path=None):
+    # the rows of the Links table, each application's rows together in book order
+    links = load_links(links_path)
+    return links.sort_values(['Application', 'Book'], kind='stable', ignore_index=True)
+
+class LinkIndex():
+    # a hash index of the link table on Application and on Application Number, each lookup is one dict lookup.
+    # The link lookup uses it when there is no sqlite output to query
+    def __init__(self, links):
+        self.links = links.reset_index(drop=True)
+        self.by_application = self.links.groupby('Application', sort=False).indices
+        self.by_number = self.links.groupby('Application Number', sort=False).indices
+
+    def find(self, value):
+        # value is an application code like NDA020702 or a bare application number, which finds every kind
+        if str(value).strip().isdigit():
+            rows = self.by_number.get(int(value), [])
+        else:
+            rows = self.by_application.get(parse_application([value])[0], [])
+        return self.links.iloc[rows]
+
+class LinkBook():
+    def __init__(self, format='xlsx', profile=None, links_path=None):
+        self.format = format
+        self.profile = profile
+        self.links_path = links_path
+
+    def process(self):
+        print('linking the books on application numbers')
+        links = Links(self.format, self.links_path)
+        links.etl(links.name, profile=self.profile)
+
+class Links(Transformer):
+    indexes = [['Application'], ['Application Number'], ['Book', 'Product']]
+    parse_cache_path = None
+    categories = ['Book']
+
+    def __init__(self, format='xlsx', links_path=None):
+        self.name = 'Links'
+        self.links_path = links_path or Transformer.links_path
+        super().__init__(self.links_path, end_data='\\finished data\\', format=format, final_columns=LINK_COLUMNS)
+
+    def _extract(self):
+        print(f'extracting the link rows in {self.links_path}')
+        return link_table(self.links_path).astype({'Book': 'category'})
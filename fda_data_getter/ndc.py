@@ -5,46 +5,63 @@ From this site download the MS Excel Zip file labeled: NDC database file - Excel
 There is a column “K” in this file labelled “Marketing Category”. Any row with this column labeled “Unapproved Homeopathic” can be deleted.
 '''
 
-import requests
-import zipfile
-import io
-from .transformer import Transformer
-import pandas as pd
-import os
-from datetime import datetime
+from .transformer import Transformer, transform
+from .fetch import Fetcher
+from .links import link_frame, parse_application
+
+NDC_URL = 'https://www.accessdata.fda.gov/cder/ndcxls.zip'
 
 class NDCBook():
-    def __init__(self, ndc_url = 'https://www.accessdata.fda.gov/cder/ndcxls.zip', 
-                        raw_data_path = 'raw_data/', format = 'xlsx'):
+    def __init__(self, ndc_url = NDC_URL, 
+                        raw_data_path = 'raw_data/', format = 'xlsx', fetcher = None, incremental = False,
+                        profile = None):
         self.ndc_url = ndc_url
+        self.profile = profile
+        self.incremental = incremental
         self.raw_data_path = raw_data_path
         self.format = format
+        self.fetcher = fetcher or Fetcher()
+        self.archive = raw_data_path + 'ndc.zip'
+        self.changed = True
+        self.urls = [ndc_url]
 
     def _get_data(self):
-        response = requests.get(self.ndc_url)
-        z = zipfile.ZipFile(io.BytesIO(response.content))
-        z.extractall(self.raw_data_path)
-        files = [self.raw_data_path+'package.xls', self.raw_data_path+'product.xls']
-        for file in files:
-            base = file.split('.')[0]
-            new_file = base+'.txt'
-            if os.path.exists(new_file):
-                os.remove(new_file)
-            os.rename(file, new_file)
+        return self.fetcher.download(self.ndc_url, self.archive)
 
-    def get_book(self):
+    def fetch(self):
         print('getting NDC data')
-        self._get_data()
+        self.changed = self._get_data()
+
+    def process(self):
         print('processing NDC data')
-        ndc = NDC('product.txt', self.raw_data_path, self.format)
-        ndc.etl(ndc.name)
+        # the "xls" members of the zip are tab separated text
+        ndc = NDC('product.xls', self.raw_data_path, self.format, archive=self.archive)
+        ndc.etl(ndc.name, self.incremental, self.profile)
+
+    def get_book(self):
+        self.fetch()
+        self.process()
 
 class NDC(Transformer):
-    def __init__(self, raw_file, raw_data_path = 'raw_data/', format='xlsx'):
+    keys = ['PRODUCTID']
+    indexes = [['PRODUCTID'], ['PRODUCTNDC'], ['APPLICATIONNUMBER'], ['LABELERNAME']]
+    # the directory keeps growing, stream it so memory stays bounded
+    chunksize = 20000
+    # arrow's chunked reader peaks at about twice the memory of read_csv's chunks, which would undo the chunking
+    parser = 'pandas'
+    sep = '\t'
+    encoding = 'cp1252'
+    # dates are yyyymmdd numbers, the end date is missing for products still on the market
+    # and the certified through date for listings that were never certified
+    schema = {'STARTMARKETINGDATE': 'int64', 'ENDMARKETINGDATE': 'int64', 'LISTING_RECORD_CERTIFIED_THROUGH': 'int64'}
+    categories = ['PRODUCTTYPENAME', 'DOSAGEFORMNAME', 'ROUTENAME', 'MARKETINGCATEGORYNAME', 'LABELERNAME',
+                    'ACTIVE_INGRED_UNIT', 'DEASCHEDULE', 'NDC_EXCLUDE_FLAG']
+
+    def __init__(self, raw_file, raw_data_path = 'raw_data/', format='xlsx', archive=None):
         self.name = 'NDC'
-        self.raw_data = raw_data_path + raw_file
+        self.raw_data = raw_file if archive else raw_data_path + raw_file
         self.format = format
-        super().__init__(self.raw_data, end_data='\\finished data\\',format=self.format,
+        super().__init__(self.raw_data, end_data='\\finished data\\',format=self.format, archive=archive,
                             final_columns = ['PRODUCTID',
                                             'PRODUCTNDC',
                                             'PRODUCTTYPENAME',
@@ -75,78 +92,62 @@ class NDC(Transformer):
                                             'Text_Start Mkt Date',
                                             'Text_End Mkt Date'])
 
-    def _extract(self):
-        print(f'extracting {self.source_data}')
-        return pd.read_csv(self.source_data, sep='\t', encoding='cp1252')
-    
-    def upper_row(self, row, col):
-        return '' if row[col] != row[col] else row[col].upper()
+    def mkt_date(self, col):
+        return self.format_dates(col, '%Y%m%d', '%m/%d/%Y', na='')
+
+    def _link_frame(self, data):
+        return link_frame(parse_application(data['APPLICATIONNUMBER']), self.name, data['PRODUCTNDC'], data['PROPRIETARYNAME'])
 
+    @transform(inputs=['MARKETINGCATEGORYNAME'], filters=True)
     def _transform_filter_homeo_out(self):
-        self.data = self.data[self.data['MARKETINGCATEGORYNAME']!='UNAPPROVED HOMEOPATHIC']
+        return self.data['MARKETINGCATEGORYNAME']!='UNAPPROVED HOMEOPATHIC'
     
+    @transform(inputs=['LABELERNAME'], outputs=['Entity_Labeler'])
     def _transform_entity_labeler(self):
-        def entity_labeler(row):
-            return self.upper_row(row, 'LABELERNAME')
-        self.data['Entity_Labeler'] = self.data.apply(entity_labeler, axis=1)
+        return {'Entity_Labeler': self.upper('LABELERNAME')}
         
+    @transform(inputs=['PROPRIETARYNAME', 'PRODUCTNDC', 'ENDMARKETINGDATE'], outputs=['Entity_End Mkt Date_Combined'])
     def _transform_entity_end_mkt_date_combined_(self):
-        def entity_end_mkt_date_combined_(row):
-            name=self.upper_row(row,'PROPRIETARYNAME')
-            ndc = row['PRODUCTNDC']
-            date = '' if row['ENDMARKETINGDATE']!=row['ENDMARKETINGDATE'] else datetime.strptime(str(int(row['ENDMARKETINGDATE'])),'%Y%m%d').strftime('%m/%d/%Y')
-            return f'End Mkt Date {name} NDC{ndc}-{date}'
-        self.data['Entity_End Mkt Date_Combined'] = self.data.apply(entity_end_mkt_date_combined_, axis=1)
+        return {'Entity_End Mkt Date_Combined': self.concat('End Mkt Date ', self.upper('PROPRIETARYNAME'),
+                                                        ' NDC', self.text('PRODUCTNDC'), '-', self.mkt_date('ENDMARKETINGDATE'))}
         
+    @transform(inputs=['ENDMARKETINGDATE'], outputs=['Entity_End Mkt Date'])
     def _transform_entity_end_mkt_date(self):
-        def entity_end_mkt_date(row):
-            return '' if row['ENDMARKETINGDATE']!=row['ENDMARKETINGDATE'] else datetime.strptime(str(int(row['ENDMARKETINGDATE'])),'%Y%m%d').strftime('%m/%d/%Y')
-        self.data['Entity_End Mkt Date'] = self.data.apply(entity_end_mkt_date, axis=1)
+        return {'Entity_End Mkt Date': self.mkt_date('ENDMARKETINGDATE')}
         
+    @transform(inputs=['STARTMARKETINGDATE'], outputs=['Text_Start Mkt Date'], per_format=True)
     def _transform_text_start_mkt_date(self):
-        def text_start_mkt_date(row):
-            return self.date_formula('' if row['STARTMARKETINGDATE']!=row['STARTMARKETINGDATE'] else datetime.strptime(str(int(row['STARTMARKETINGDATE'])),'%Y%m%d').strftime('%m/%d/%Y'))
-        self.data['Text_Start Mkt Date'] = self.data.apply(text_start_mkt_date, axis=1)
+        return {'Text_Start Mkt Date': self.text_dates('STARTMARKETINGDATE', '%Y%m%d', '%m/%d/%Y', na='')}
         
+    @transform(inputs=['PROPRIETARYNAME', 'PRODUCTNDC', 'STARTMARKETINGDATE'], outputs=['Entity_Start Mkt Date_Combined'])
     def _transform_entity_start_mkt_date_combined(self):
-        def entity_start_mkt_date_combined(row):
-            date = '' if row['STARTMARKETINGDATE']!=row['STARTMARKETINGDATE'] else datetime.strptime(str(int(row['STARTMARKETINGDATE'])),'%Y%m%d').strftime('%m/%d/%Y')
-            name=self.upper_row(row,'PROPRIETARYNAME')
-            ndc = row['PRODUCTNDC']
-            return f'Start Mkt Date {name} NDC{ndc}-{date}'
-        self.data['Entity_Start Mkt Date_Combined'] = self.data.apply(entity_start_mkt_date_combined, axis=1)
+        return {'Entity_Start Mkt Date_Combined': self.concat('Start Mkt Date ', self.upper('PROPRIETARYNAME'),
+                                                        ' NDC', self.text('PRODUCTNDC'), '-', self.mkt_date('STARTMARKETINGDATE'))}
         
+    @transform(inputs=['PROPRIETARYNAME', 'PRODUCTNDC'], outputs=['Entity_Trade Name_NDC'])
     def _transform_entity_trade_name_ndc(self):
-        def entity_trade_name_ndc(row):
-            name= self.upper_row(row,'PROPRIETARYNAME')
-            ndc = row['PRODUCTNDC']
-            return f'{name} NDC{ndc}'
-        self.data['Entity_Trade Name_NDC'] = self.data.apply(entity_trade_name_ndc, axis=1)
+        return {'Entity_Trade Name_NDC': self.concat(self.upper('PROPRIETARYNAME'), ' NDC', self.text('PRODUCTNDC'))}
         
+    @transform(inputs=['ENDMARKETINGDATE'], outputs=['Text_End Mkt Date'], per_format=True)
     def _transform_text_end_mkt_date(self):
-        def text_end_mkt_date(row):
-            return self.date_formula('' if row['ENDMARKETINGDATE']!=row['ENDMARKETINGDATE'] else datetime.strptime(str(int(row['ENDMARKETINGDATE'])),'%Y%m%d').strftime('%m/%d/%Y'))
-        self.data['Text_End Mkt Date'] = self.data.apply(text_end_mkt_date, axis=1)
+        return {'Text_End Mkt Date': self.text_dates('ENDMARKETINGDATE', '%Y%m%d', '%m/%d/%Y', na='')}
         
+    @transform(inputs=['PHARM_CLASSES'], outputs=['Entity_PHARM_CLASSES'])
     def _transform_entity_pharm_classes(self):
-        self.data['Entity_PHARM_CLASSES'] = self.data['PHARM_CLASSES']
+        return {'Entity_PHARM_CLASSES': self.data['PHARM_CLASSES']}
         
+    @transform(inputs=['NONPROPRIETARYNAME'], outputs=['Entity_NonProp Name'])
     def _transform_entity_nonprop_name(self):
-        def entity_nonprop_name(row):
-            name = self.upper_row(row, 'NONPROPRIETARYNAME')
-            return f'{name} (NonProp Name)'
-        self.data['Entity_NonProp Name'] = self.data.apply(entity_nonprop_name, axis=1)
+        return {'Entity_NonProp Name': self.concat(self.upper('NONPROPRIETARYNAME'), ' (NonProp Name)')}
         
+    @transform(outputs=['Source'])
     def _transform_source(self):
-        self.data['Source'] = 'FDA Nationla Drug Code Directory'
+        return {'Source': 'FDA Nationla Drug Code Directory'}
         
+    @transform(inputs=['STARTMARKETINGDATE'], outputs=['Entity_Start Mkt Date'])
     def _transform_entity_start_mkt_date(self):
-        def entity_start_mkt_date(row):
-            return '' if row['STARTMARKETINGDATE']!=row['STARTMARKETINGDATE'] else datetime.strptime(str(int(row['STARTMARKETINGDATE'])),'%Y%m%d').strftime('%m/%d/%Y')
-        self.data['Entity_Start Mkt Date'] = self.data.apply(entity_start_mkt_date, axis=1)
+        return {'Entity_Start Mkt Date': self.mkt_date('STARTMARKETINGDATE')}
         
+    @transform(inputs=['PROPRIETARYNAME'], outputs=['Entity-Trade Name'])
     def _transform_entity_trade_name(self):
-        def entity_trade_name(row):
-            name = self.upper_row(row, 'PROPRIETARYNAME')
-            return f'{name} (Trade Name)'
-        self.data['Entity-Trade Name'] = self.data.apply(entity_trade_name, axis=1)
\ No newline at end of file
+        return {'Entity-Trade Name': self.concat(self.upper('PROPRIETARYNAME'), ' (Trade Name)')}
\ No newline at end of file
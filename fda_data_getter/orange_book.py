@@ -8,47 +8,145 @@ Website: https://www.fda.gov/drugs/drug-approvals-and-databases/orange-book-data
 They are downloaded in a zip file with three CSV files, one each for products, patents, and exclusivity.
 '''
 
-import requests
-import zipfile
-import io
-from .transformer import Transformer
+from .transformer import Transformer, transform
+from .fetch import Fetcher
+from .links import APPLICATION_KINDS, application, link_frame
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+import sys
 from datetime import datetime
+import pandas as pd
 import numpy as np
 
+ORANGE_BOOK_URL = 'https://www.fda.gov/media/76860/download'
+OB_DATE = '%b %d, %Y'
+ENTITY_DATE = '%#m/%#d/%Y'
+PRIOR_TO_1982 = {'Approved Prior to Jan 1, 1982': 'Jan 1, 1982'}
+# identifier strings of a product, from its application and product numbers, upper-cased trade name and molecule
+ENTITY_KEYS = {'AP#PR#': lambda ap, pr, trade, molecule: 'AP#' + ap + 'PR#' + pr,
+                '#PR#': lambda ap, pr, trade, molecule: '#' + ap + 'PR#' + pr,
+                'Trade_Name': lambda ap, pr, trade, molecule: trade,
+                'Trade AP#PR#': lambda ap, pr, trade, molecule: trade + ' AP#' + ap + 'PR#' + pr,
+                'Trade AP# PR#': lambda ap, pr, trade, molecule: trade + ' AP#' + ap + ' PR#' + pr,
+                'Molecule AP# PR#': lambda ap, pr, trade, molecule: molecule + ' AP#' + ap + ' PR#' + pr}
+
 class OrangeBook():
-    def __init__(self, orange_book_url = 'https://www.fda.gov/media/76860/download', 
-                        raw_data_path = 'raw_data/', format='xlsx'):
+    def __init__(self, orange_book_url = ORANGE_BOOK_URL, 
+                        raw_data_path = 'raw_data/', format='xlsx', fetcher = None, jobs = 1, incremental = False,
+                        unmatched = 'raise', profile = None):
         self.orange_book_url = orange_book_url
+        self.profile = profile
+        self.unmatched = unmatched
+        self.jobs = jobs
+        self.incremental = incremental
         self.raw_data_path = raw_data_path
         self.format = format
+        self.fetcher = fetcher or Fetcher()
+        self.archive = raw_data_path + 'orange_book.zip'
+        self.changed = True
+        self.urls = [orange_book_url]
         
-    def _get_unzipped_data(self):
-        response = requests.get(self.orange_book_url)
-        z = zipfile.ZipFile(io.BytesIO(response.content))
-        z.extractall(self.raw_data_path)
+    def _get_zipped_data(self):
+        return self.fetcher.download(self.orange_book_url, self.archive)
 
-    def get_book(self):
-        print('processing orange book data')
+    def fetch(self):
         print(f'   getting orange book data from {self.orange_book_url}')
-        self._get_unzipped_data()
-        print('processing product data')
-        products = Product('products.txt', self.raw_data_path, self.format)
-        products.etl(products.name)
-        trade_name_map = products.yield_trade_name_map()
-        molecule_map = products.yield_molecule_map()
-        print('processing exclusivity data')
-        exclusivity = Exclusivity('exclusivity.txt', molecule_map, self.raw_data_path, self.format)
-        exclusivity.etl(exclusivity.name)
-        print('processing patent data')
-        patents = Patent('patent.txt', trade_name_map, self.raw_data_path, self.format)
-        patents.etl(patents.name)
+        self.changed = self._get_zipped_data()
+
+    def process(self):
+        print('processing orange book data')
+        # exclusivity and patents only need the product keys, they get them once products are transformed
+        exclusivity = Exclusivity('exclusivity.txt', None, self.raw_data_path, self.format, 
+                                    archive=self.archive, unmatched=self.unmatched)
+        patents = Patent('patent.txt', None, self.raw_data_path, self.format, 
+                            archive=self.archive, unmatched=self.unmatched)
+        futures = []
+        with ExitStack() as stack:
+            if self.jobs > 1:
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=2))
+            else:
+                # a thread each, their sources are read while products are transformed
+                threads = [stack.enter_context(ThreadPoolExecutor(max_workers=1)) for _ in range(2)]
+                exclusivity.prefetch(threads[0])
+                patents.prefetch(threads[1])
+
+            def start(products):
+                entity_keys = products.entity_keys()
+                exclusivity.entity_keys = entity_keys
+                patents.entity_keys = entity_keys
+                # side by side with each other and with the products load
+                print('processing exclusivity and patent data')
+                sys.stdout.flush()
+                if self.jobs > 1:
+                    futures.extend(pool.submit(book.etl, book.name, self.incremental, self.profile)
+                                    for book in (exclusivity, patents))
+                else:
+                    futures.extend(thread.submit(book.etl, book.name, self.incremental, self.profile)
+                                    for thread, book in zip(threads, (exclusivity, patents)))
+
+            print('processing product data')
+            products = Product('products.txt', self.raw_data_path, self.format, archive=self.archive)
+            products.etl(products.name, self.incremental, self.profile, transformed=start)
+            for future in futures:
+                future.result()
+
+    def get_book(self):
+        self.fetch()
+        self.process()
+
+class EntityKeys():
+    # the ENTITY_KEYS strings of every product, formatted once from the products and looked up by exclusivity and
+    # patents. A product listed more than once keeps its last listing. Looked up columns are categoricals over these
+    # strings, so each string is held once however many rows refer to the product
+    def __init__(self, products):
+        products = products.drop_duplicates(['Appl_No', 'Product_No'], keep='last')
+        self.entities = pd.DataFrame({'entity': np.arange(len(products))},
+                                        index=pd.MultiIndex.from_frame(products[['Appl_No', 'Product_No']]))
+        self.trade_names = products['Trade_Name'].set_axis(self.entities.index)
+        self.products = products
+        self.keys = dict()
+
+    def key(self, name):
+        # codes of each entity into the distinct strings, -1 where the string is missing and for entity -1,
+        # formatted the first time a transformer asks for them
+        if name not in self.keys:
+            products = self.products
+            strings = ENTITY_KEYS[name](products['Appl_No'].astype(str), products['Product_No'].astype(str),
+                                        products['Trade_Name'], products['Ingredient'])
+            codes, strings = pd.factorize(strings)
+            self.keys[name] = np.append(codes, -1), strings
+        return self.keys[name]
+
+    def lookup(self, transformer, name):
+        # the named string of each row's product, rows the unmatched policy left blank are formatted from
+        # their own application and product numbers with a blank trade name and molecule
+        entity = transformer.lookup(self.entities, 'entity').replace('', -1).astype('int64').to_numpy()
+        codes, strings = self.key(name)
+        # a column holds only the strings of the products its rows refer to
+        values = pd.Series(pd.Categorical.from_codes(codes[entity], strings), index=transformer.data.index)
+        values = values.cat.remove_unused_categories()
+        if (entity < 0).any():
+            # the blank policy blanks every missing string of the joined products, as well as the rows it blanks
+            blank = codes[entity] < 0
+            values = values.astype(strings.dtype)
+            values[blank] = ENTITY_KEYS[name](transformer.text('Appl_No')[blank], transformer.text('Product_No')[blank], '', '')
+        return values
+
+    def text(self, transformer, name):
+        values = self.lookup(transformer, name)
+        return values.astype(values.cat.categories.dtype) if isinstance(values.dtype, pd.CategoricalDtype) else values
 
 class Product(Transformer):
-    def __init__(self, raw_file, raw_data_path = 'raw_data/', format='xlsx'):
+    keys = ['Appl_No', 'Product_No']
+    indexes = [['Appl_No', 'Product_No']]
+    schema = {'Appl_No': 'int64', 'Product_No': 'int64'}
+    categories = ['DF;Route', 'Applicant', 'Appl_Type', 'TE_Code', 'RLD', 'RS', 'Type', 'Applicant_Full_Name']
+
+    def __init__(self, raw_file, raw_data_path = 'raw_data/', format='xlsx', archive=None):
         self.name = 'OBProd'
-        self.raw_data = raw_data_path + raw_file
+        self.raw_data = raw_file if archive else raw_data_path + raw_file
         self.format = format
-        super().__init__(self.raw_data, end_data='\\finished data\\', format = self.format,
+        super().__init__(self.raw_data, end_data='\\finished data\\', format = self.format, archive = archive,
                             final_columns = ['Entity_NonProp Name', 'Ingredient', 'DF',
                                 'Route', 'Entity_Trade Name', 'Trade_Name', 'Applicant',
                                 'Strength', 'Appl_Type', 'Entity_Trade Name_AP#PR#',
@@ -57,140 +155,120 @@ class Product(Transformer):
                                 'RLD', 'RS', 'Type', 'Applicant_Full_Name', 'Source',
                                 'Text Approval Date'])
         
+    def approval_date(self):
+        return self.parse_dates('Approval_Date', OB_DATE, aliases=PRIOR_TO_1982)
+
+    def text_approval_date(self):
+        return self.format_dates('Approval_Date', OB_DATE, ENTITY_DATE, aliases=PRIOR_TO_1982)
+
+    @transform(inputs=['Ingredient'], outputs=['Entity_NonProp Name'])
     def _transform_Entity_NonProp_Name(self):
-        def Entity_NonProp_Name(row):
-            ingredient = row['Ingredient'].upper()
-            return f'{ingredient} (NonProp Name)'
-        self.data['Entity_NonProp Name'] = self.data.apply(Entity_NonProp_Name, axis = 1)
+        return {'Entity_NonProp Name': self.concat(self.upper('Ingredient'), ' (NonProp Name)')}
     
+    @transform(inputs=['DF;Route'], outputs=['DF', 'Route'])
     def _transform_DF_Route_split(self):
-        self.data['DF'] = self.data['DF;Route'].apply(lambda row: row.split(';')[0])
-        self.data['Route'] = self.data['DF;Route'].apply(lambda row: row.split(';')[1]) 
+        df_route = self.column('DF;Route').str.split(';')
+        return {'DF': df_route.str[0], 'Route': df_route.str[1]}
     
+    @transform(inputs=['Trade_Name'], outputs=['Entity_Trade Name'])
     def _transform_Entity_Trade_Name(self):
-        def Entity_Trade_Name(row):
-            trade_name = row['Trade_Name'].upper()
-            return f'{trade_name} (Trade Name)'
-        self.data['Entity_Trade Name'] = self.data.apply(Entity_Trade_Name, axis=1)
+        return {'Entity_Trade Name': self.concat(self.upper('Trade_Name'), ' (Trade Name)')}
     
+    @transform(inputs=['Trade_Name', 'Appl_No', 'Product_No'], outputs=['Entity_Trade Name_AP#PR#'])
     def _transform_Entity_Trade_Name_AP_PR_(self):
-        def Entity_Trade_Name_AP_PR_(row):
-            trade_name = row['Trade_Name'].upper()
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            return f'{trade_name} AP#{ap} PR#{pr}'
-        self.data['Entity_Trade Name_AP#PR#'] = self.data.apply(Entity_Trade_Name_AP_PR_, axis=1)
+        return {'Entity_Trade Name_AP#PR#': self.concat(self.upper('Trade_Name'), ' AP#', self.text('Appl_No'),
+                                                    ' PR#', self.text('Product_No'))}
 
+    @transform(inputs=['Trade_Name', 'Appl_No', 'Product_No', 'Approval_Date'], outputs=['Entity_Trade Name_AP#PR#_App Date'])
     def _transform_Entity_Trade_Name_AP_PR_App_Date(self):
-        def Entity_Trade_Name_AP_PR_App_Date(row):
-            trade_name = row['Trade_Name'].upper()
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            appr_date = 'Jan 1, 1982' if row['Approval_Date'] == 'Approved Prior to Jan 1, 1982' else row['Approval_Date'] 
-            appr_date = datetime.strptime(appr_date,'%b %d, %Y').strftime('%#m/%#d/%Y')
-            return f'Appr Date {trade_name} AP#{ap}PR#{pr}-{appr_date}'
-        self.data['Entity_Trade Name_AP#PR#_App Date'] = self.data.apply(Entity_Trade_Name_AP_PR_App_Date, axis=1)
+        appr_date = self.text_approval_date()
+        return {'Entity_Trade Name_AP#PR#_App Date': self.concat('Appr Date ', self.upper('Trade_Name'), 
+                                                        ' AP#', self.text('Appl_No'), 'PR#', self.text('Product_No'), 
+                                                        '-', appr_date)}
     
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Entity_AP#PR#'])
     def _transform_Entity_App_PR_(self):
-        def Entity_App_PR_(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            return f'AP#{ap}PR#{pr}'
-        self.data['Entity_AP#PR#'] = self.data.apply(Entity_App_PR_, axis = 1)
+        return {'Entity_AP#PR#': self.concat('AP#', self.text('Appl_No'), 'PR#', self.text('Product_No'))}
         
+    @transform(inputs=['Approval_Date'], outputs=['Entity_Approval_Date'])
     def _transform_Entity_Approval_Date(self):
-        def convert_text_date_to_excel_ordinal(datetime) :
-            offset = 693594
-            n = datetime.toordinal()
-            return (n - offset)
-
-        def get_approval_date(row):
-            date = 'Jan 1, 1982' if row['Approval_Date'] == 'Approved Prior to Jan 1, 1982' else row['Approval_Date'] 
-            return datetime.strptime(str(date),'%b %d, %Y')
-                
-        self.data['Entity_Approval_Date']=self.data.apply(lambda row: convert_text_date_to_excel_ordinal(get_approval_date(row)), axis = 1)
-        self.data['Text Approval Date']=self.data.apply(lambda row: self.date_formula(get_approval_date(row).strftime('%#m/%#d/%Y')), axis = 1)
+        # days since the excel epoch, i.e. datetime.toordinal() - 693594
+        approval_date = self.approval_date()
+        return {'Entity_Approval_Date': (approval_date - datetime(1899, 12, 30)).dt.days}
+
+    @transform(inputs=['Approval_Date'], outputs=['Text Approval Date'], per_format=True)
+    def _transform_Text_Approval_Date(self):
+        return {'Text Approval Date': self.text_dates('Approval_Date', OB_DATE, ENTITY_DATE, aliases=PRIOR_TO_1982)}
 
+    @transform(outputs=['Source'])
     def _transform_Source(self):
-        self.data['Source'] = 'FDA Orange Book'
-
-    def yield_molecule_map(self):
-        records = self.data[['Ingredient', 'Appl_No', 'Product_No']].to_dict(orient='records')
-        molecule_map = dict()
-        for record in records:
-            ap = record['Appl_No']
-            pr = record['Product_No']
-            ingredient = record['Ingredient'].upper()
-            if ap in molecule_map.keys():
-                molecule_map[ap][pr] = ingredient
-            else:
-                molecule_map[ap] = {pr:ingredient}
-        return molecule_map
-
-    def yield_trade_name_map(self):
-        records = self.data[['Trade_Name', 'Appl_No', 'Product_No']].to_dict(orient='records')
-        trade_name_map = dict()
-        for record in records:
-            ap = record['Appl_No']
-            pr = record['Product_No']
-            trade_name = record['Trade_Name'].upper()
-            if ap in trade_name_map.keys():
-                trade_name_map[ap][pr] = trade_name
-            else:
-                trade_name_map[ap] = {pr:trade_name}
-        return trade_name_map
+        return {'Source': 'FDA Orange Book'}
+
+    def _link_frame(self, data):
+        return link_frame(application(data['Appl_Type'].map(APPLICATION_KINDS), data['Appl_No']), self.name,
+                            data['Product_No'].astype(str).str.zfill(3), data['Trade_Name'])
+
+    def entity_keys(self):
+        return EntityKeys(pd.DataFrame({'Appl_No': self.data['Appl_No'], 'Product_No': self.data['Product_No'],
+                                        'Trade_Name': self.upper('Trade_Name', np.nan), 'Ingredient': self.upper('Ingredient', np.nan)}))
 
 class Exclusivity(Transformer):
-    def __init__(self, raw_file, molecule_map, raw_data_path = 'raw_data/', format='xlsx'):
+    indexes = [['Appl_No', 'Product_No']]
+    schema = {'Appl_No': 'int64', 'Product_No': 'int64'}
+    categories = ['Appl_Type', 'Exclusivity_Code']
+
+    def __init__(self, raw_file, entity_keys, raw_data_path = 'raw_data/', format='xlsx', archive=None, unmatched='raise'):
         self.name = 'OBExcl'
-        self.raw_data = raw_data_path + raw_file
-        self.molecule_map = molecule_map
+        self.raw_data = raw_file if archive else raw_data_path + raw_file
+        self.entity_keys = entity_keys
+        self.unmatched = unmatched
         self.format = format
-        super().__init__(self.raw_data, end_data = '\\finished data\\', format = self.format, 
+        super().__init__(self.raw_data, end_data = '\\finished data\\', format = self.format, archive = archive,
                             final_columns = ['Appl_Type', 
                                 'Entity_Excl Date_Combined', 'Entity_App#PR#', 
                                 'Entity_Trade_AP#PR#', 'Appl_No', 'Product_No', 
                                 'Exclusivity_Code', 'Entity_Exclusivity_Date',
                                 'Text_Exclusivity Date','Source'])
 
+    @transform(inputs=['Exclusivity_Date', 'Exclusivity_Code', 'Appl_No', 'Product_No'], outputs=['Entity_Excl Date_Combined'])
     def _transform_Entity_Excl_Date_Combined(self):
-        def Entity_Excl_Date_Combined(row):
-            excl_code = row['Exclusivity_Code']
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            excl_date = datetime.strptime(row['Exclusivity_Date'],'%b %d, %Y').strftime('%#m/%#d/%Y')
-            return f'Excl Date ({excl_code}) AP#{ap}PR#{pr}-{excl_date}'
-        self.data['Entity_Excl Date_Combined'] = self.data.apply(Entity_Excl_Date_Combined, axis = 1)
+        excl_date = self.format_dates('Exclusivity_Date', OB_DATE, ENTITY_DATE)
+        return {'Entity_Excl Date_Combined': self.concat('Excl Date (', self.text('Exclusivity_Code'), ') ',
+                                                self.entity_keys.text(self, 'AP#PR#'), '-', excl_date)}
 
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Entity_App#PR#'])
     def _transform_Entity_App_PR_(self):
-        def Entity_App_PR_(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            return f'AP#{ap}PR#{pr}'
-        self.data['Entity_App#PR#'] = self.data.apply(Entity_App_PR_, axis = 1)
+        return {'Entity_App#PR#': self.entity_keys.lookup(self, 'AP#PR#')}
     
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Entity_Trade_AP#PR#'])
     def _transform_Entity_Trade_AP_PR_(self):
-        def Entity_Trade_AP_PR_(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            molecule = self.molecule_map[ap][pr]
-            return f'{molecule} AP#{ap} PR#{pr}'
-        self.data['Entity_Trade_AP#PR#'] = self.data.apply(Entity_Trade_AP_PR_, axis = 1)
+        return {'Entity_Trade_AP#PR#': self.entity_keys.lookup(self, 'Molecule AP# PR#')}
+
+    @transform(inputs=['Exclusivity_Date'], outputs=['Entity_Exclusivity_Date'])
+    def _transform_Entity_Exclusivity_Date(self):
+        return {'Entity_Exclusivity_Date': self.format_dates('Exclusivity_Date', OB_DATE, ENTITY_DATE)}
 
-    def _transform_add_dates_and_source(self):
-        self.data['Entity_Exclusivity_Date']=self.data['Exclusivity_Date'].apply(lambda date: datetime.strptime(date,'%b %d, %Y').strftime('%#m/%#d/%Y'))
-        self.data['Text_Exclusivity Date']=self.date_formula(self.data['Exclusivity_Date'].apply(lambda date: datetime.strptime(date,'%b %d, %Y').strftime('%#m/%#d/%Y')))
+    @transform(inputs=['Exclusivity_Date'], outputs=['Text_Exclusivity Date'], per_format=True)
+    def _transform_Text_Exclusivity_Date(self):
+        return {'Text_Exclusivity Date': self.text_dates('Exclusivity_Date', OB_DATE, ENTITY_DATE)}
 
+    @transform(outputs=['Source'])
     def _transform_Source(self):
-        self.data['Source'] = 'FDA Orange Book'
+        return {'Source': 'FDA Orange Book'}
 
 class Patent(Transformer):
-    def __init__(self, raw_file, trade_name_map, raw_data_path = 'raw_data/', format='xlsx'):
+    keys = ['Patent_No', 'Appl_No', 'Product_No']
+    indexes = [['Appl_No', 'Product_No'], ['Patent_No']]
+    schema = {'Appl_No': 'int64', 'Product_No': 'int64'}
+    categories = ['Appl_Type', 'Drug_Substance_Flag', 'Drug_Product_Flag', 'Patent_Use_Code', 'Delist_Flag']
+
+    def __init__(self, raw_file, entity_keys, raw_data_path = 'raw_data/', format='xlsx', archive=None, unmatched='raise'):
         self.name = 'OBPat'
-        self.raw_data = raw_data_path + raw_file
-        self.trade_name_map = trade_name_map
+        self.raw_data = raw_file if archive else raw_data_path + raw_file
+        self.entity_keys = entity_keys
+        self.unmatched = unmatched
         self.format = format
-        super().__init__(self.raw_data, end_data = '\\finished data\\', format = self.format,
+        super().__init__(self.raw_data, end_data = '\\finished data\\', format = self.format, archive = archive,
                             final_columns = ['Appl_Type', 'Entity_AP#PR#',
                                 'Appl_No', 'Product_No', 'Entity_Pat Sub_Combined',
                                 'Entity_Pat Exp_Combined', 'Entity_Pat#_Trade_AP#PR#',
@@ -200,95 +278,65 @@ class Patent(Transformer):
                                 'Text_Patent_Expire_Date_Text', 'Text_Submission_Date',
                                 'Entity_Trade_AP#PR#2', 'Trade Name', 'Column1'])
     
+    def _delta_frame(self, data):
+        # a product's trade name changing changes its patents' output as well
+        keys = pd.MultiIndex.from_frame(data[['Appl_No', 'Product_No']])
+        return data.assign(**{'Trade Name': self.entity_keys.trade_names.reindex(keys).to_numpy()})
+
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Column1'])
     def _transform_Column1(self):
-        def column1(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            return f'#{ap}PR#{pr}'
-        self.data['Column1'] = self.data.apply(column1, axis = 1)
+        return {'Column1': self.entity_keys.lookup(self, '#PR#')}
     
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Trade Name'])
     def _transform_Trade_Name(self):
-        def Trade_Name(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            trade_name = self.trade_name_map[ap][pr]
-            return trade_name            
-        self.data['Trade Name'] = self.data.apply(Trade_Name, axis = 1)
+        return {'Trade Name': self.entity_keys.lookup(self, 'Trade_Name')}
 
+    @transform(inputs=['Submission_Date'], outputs=['Text_Submission_Date'], per_format=True)
     def _transform_Text_Submission_Date(self):
-        def Text_Submission_Date(date):
-            return datetime.strptime(date,'%b %d, %Y').strftime('%#m/%#d/%Y') if not date != date else np.nan
-        self.data['Text_Submission_Date']=self.date_formula(self.data['Submission_Date'].apply(lambda date: Text_Submission_Date(date)))
+        return {'Text_Submission_Date': self.text_dates('Submission_Date', OB_DATE, ENTITY_DATE)}
 
+    @transform(inputs=['Patent_Expire_Date_Text'], outputs=['Text_Patent_Expire_Date_Text'], per_format=True)
     def _transform_Text_Patent_Expire_Date_Text(self):
-        def Text_Submission_Date(date):
-            return datetime.strptime(date,'%b %d, %Y').strftime('%#m/%#d/%Y') if not date != date else np.nan
-        self.data['Text_Patent_Expire_Date_Text']=self.date_formula(self.data['Patent_Expire_Date_Text'].apply(lambda date: Text_Submission_Date(date)))
+        return {'Text_Patent_Expire_Date_Text': self.text_dates('Patent_Expire_Date_Text', OB_DATE, ENTITY_DATE)}
     
+    @transform(inputs=['Submission_Date'], outputs=['Entity_Submission_Date'])
     def _transform_Entity_Submission_Date(self):
-        def Text_Submission_Date(date):
-            return datetime.strptime(date,'%b %d, %Y').strftime('%#m/%#d/%Y') if not date != date else np.nan
-        self.data['Entity_Submission_Date']=self.data['Submission_Date'].apply(lambda date: Text_Submission_Date(date))
+        return {'Entity_Submission_Date': self.format_dates('Submission_Date', OB_DATE, ENTITY_DATE)}
 
+    @transform(inputs=['Patent_Expire_Date_Text'], outputs=['Entity_Patent_Expire_Date'])
     def _transform_Entity_Patent_Expire_Date(self):
-        def Text_Submission_Date(date):
-            return datetime.strptime(date,'%b %d, %Y').strftime('%#m/%#d/%Y') if not date != date else np.nan
-        self.data['Entity_Patent_Expire_Date']=self.data['Patent_Expire_Date_Text'].apply(lambda date: Text_Submission_Date(date))
+        return {'Entity_Patent_Expire_Date': self.format_dates('Patent_Expire_Date_Text', OB_DATE, ENTITY_DATE)}
     
+    @transform(inputs=['Patent_No'], outputs=['Entity_Pat#'])
     def _transform_Entity_Pat_(self):
-        def Entity_Pat(patent_no):
-            return f'Pat#{patent_no}'
-        self.data['Entity_Pat#'] = self.data['Patent_No'].apply(lambda patent_no: Entity_Pat(patent_no))
+        return {'Entity_Pat#': self.concat('Pat#', self.text('Patent_No'))}
     
+    @transform(inputs=['Patent_Expire_Date_Text', 'Patent_Use_Code', 'Patent_No', 'Appl_No', 'Product_No'],
+                outputs=['Entity_Pat Exp_Combined'])
     def _transform_Entity_Pat_Exp_Combined(self):
-        def entity_pat_exp_combined(row):
-            use_code = row['Patent_Use_Code']
-            patent = row['Patent_No']
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            exp_date = row['Patent_Expire_Date_Text']
-            exp_date = datetime.strptime(exp_date,'%b %d, %Y').strftime('%#m/%#d/%Y')
-            return f'Pat Exp ({use_code}) Pat#{patent} AP#{ap}PR#{pr}-{exp_date}'
-        self.data['Entity_Pat Exp_Combined'] = self.data.apply(entity_pat_exp_combined, axis = 1)
+        exp_date = self.format_dates('Patent_Expire_Date_Text', OB_DATE, ENTITY_DATE)
+        return {'Entity_Pat Exp_Combined': self.concat('Pat Exp (', self.text('Patent_Use_Code'), ') Pat#', 
+                                                self.text('Patent_No'), ' ', self.entity_keys.text(self, 'AP#PR#'), '-', exp_date)}
     
+    @transform(inputs=['Submission_Date', 'Patent_Use_Code', 'Patent_No', 'Appl_No', 'Product_No'],
+                outputs=['Entity_Pat Sub_Combined'])
     def _transform_Entity_Pat_Sub_Combined(self):
-        def entity_pat_sub_combined(row):
-            use_code = row['Patent_Use_Code']
-            patent = row['Patent_No']
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            sub_date = row['Submission_Date']
-            if sub_date != sub_date:
-                sub_date = ''
-            else:
-                sub_date = datetime.strptime(sub_date,'%b %d, %Y').strftime('%#m/%#d/%Y') 
-            return f'Pat Sub  ({use_code}) Pat#{patent} AP#{ap}PR#{pr}-{sub_date}'
-        self.data['Entity_Pat Sub_Combined'] = self.data.apply(entity_pat_sub_combined, axis = 1)
+        sub_date = self.format_dates('Submission_Date', OB_DATE, ENTITY_DATE, na='')
+        return {'Entity_Pat Sub_Combined': self.concat('Pat Sub  (', self.text('Patent_Use_Code'), ') Pat#', 
+                                                self.text('Patent_No'), ' ', self.entity_keys.text(self, 'AP#PR#'), '-', sub_date)}
 
+    @transform(inputs=['Patent_No', 'Appl_No', 'Product_No'], outputs=['Entity_Pat#_Trade_AP#PR#'])
     def _transform_entity_Pat_Trade_AP_PR(self):
-        def entity_Pat_Trade_AP_PR(row):
-            patent = row['Patent_No']
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            trade_name = self.trade_name_map[ap][pr]
-            return f'Pat#{patent} {trade_name} AP#{ap}PR#{pr}'
-        self.data['Entity_Pat#_Trade_AP#PR#'] = self.data.apply(entity_Pat_Trade_AP_PR, axis=1)
+        return {'Entity_Pat#_Trade_AP#PR#': self.concat('Pat#', self.text('Patent_No'), ' ', self.entity_keys.text(self, 'Trade AP#PR#'))}
 
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Entity_AP#PR#'])
     def _transform_Entity_App_PR_(self):
-        def Entity_App_PR_(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            return f'AP#{ap}PR#{pr}'
-        self.data['Entity_AP#PR#'] = self.data.apply(Entity_App_PR_, axis = 1)
+        return {'Entity_AP#PR#': self.entity_keys.lookup(self, 'AP#PR#')}
 
+    @transform(inputs=['Appl_No', 'Product_No'], outputs=['Entity_Trade_AP#PR#2'])
     def _transform_Entity_Trade_AP_PR_2(self):
-        def Entity_Trade_AP_PR_(row):
-            ap = row['Appl_No']
-            pr = row['Product_No']
-            trade_name = self.trade_name_map[ap][pr]
-            return f'{trade_name} AP#{ap} PR#{pr}'
-        self.data['Entity_Trade_AP#PR#2'] = self.data.apply(Entity_Trade_AP_PR_, axis = 1)
+        return {'Entity_Trade_AP#PR#2': self.entity_keys.lookup(self, 'Trade AP# PR#')}
     
+    @transform(outputs=['Source'])
     def _transform_Source(self):
-        self.data['Source'] = 'FDA Orange Book'
-    
\ No newline at end of file
+        return {'Source': 'FDA Orange Book'}
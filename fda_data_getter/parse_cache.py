@@ -0,0 +1,49 @@
+'''
+On-disk cache of parsed sources, so reruns and runs in another output format skip parsing the raw text.
+An entry is the pickled extract of one transformer's source, keyed on the sha256 of the raw bytes and on
+everything else that decides how they parse: the transformer's categorical columns, the pandas version and
+PARSER_VERSION. Pickles keep every dtype exactly as parsed, categoricals and mixed columns included.
+Only the newest entry of each transformer and source is kept.
+'''
+
+import os
+import glob
+import hashlib
+import pandas as pd
+
+# bump when a change to parsing would make existing entries wrong
+PARSER_VERSION = 2
+
+def content_hash(stream, chunk_size=1024*1024):
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+class ParseCache():
+    def __init__(self, path, name):
+        # name tells apart the entries of different transformers and sources
+        self.path = path
+        self.name = name
+
+    def key(self, raw_hash, *details):
+        parts = [raw_hash, str(PARSER_VERSION), pd.__version__, *map(str, details)]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+    def entry(self, key):
+        return os.path.join(self.path, f'{self.name}.{key}.pkl')
+
+    def load(self, key):
+        # None when the source hasn't been parsed with this key before
+        if not os.path.exists(self.entry(key)):
+            return None
+        return pd.read_pickle(self.entry(key))
+
+    def save(self, key, data):
+        os.makedirs(self.path, exist_ok=True)
+        entry = self.entry(key)
+        data.to_pickle(entry+'.part')
+        os.replace(entry+'.part', entry)
+        for old in glob.glob(os.path.join(glob.escape(self.path), glob.escape(self.name)+'.*.pkl')):
+            if old != entry:
+                os.remove(old)
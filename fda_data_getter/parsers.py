@@ -0,0 +1,209 @@
+'''
+Parsers for the raw sources. 'pandas' is pandas' C parser, 'arrow' is pyarrow's CSV reader, which parses
+blocks of a source on every core. Plain utf-8 files are memory mapped, archive members are copied as utf-8 first.
+The arrow parser gives the DataFrame read_csv would: the transformer's schema types the columns that aren't text,
+every other column is read as text with read_csv's missing values, and categoricals get read_csv's sorted categories.
+A source that doesn't fit its schema raises SchemaMismatch so it can be read with pandas instead.
+JSON arrays of records, like the Purple Book patent list, are decoded a record at a time into the same kind of frame.
+'''
+
+import io
+import re
+import csv
+import json
+import operator
+import codecs
+import contextlib
+import tempfile
+import os
+import importlib.util
+import numpy as np
+import pandas as pd
+
+PARSERS = ('pandas', 'arrow')
+# read_csv's default na_values
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+class SchemaMismatch(ValueError):
+    pass
+
+def arrow_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+def arrow_type(dtype):
+    import pyarrow as pa
+    if isinstance(dtype, pd.CategoricalDtype) or dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    if pd.api.types.is_string_dtype(dtype):
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+@contextlib.contextmanager
+def arrow_input(source, encoding, spool=False):
+    # arrow reads a plain utf-8 file itself, memory mapped, or a block at a time when spool is set for chunked reads.
+    # Archive members and other encodings are copied as utf-8 first, into memory or with spool into a temporary file,
+    # as arrow would otherwise call back into python from its own threads to read and decode them.
+    # A spooled copy is made a small block at a time, as each block is held three times over while it's decoded
+    import pyarrow as pa
+    utf8 = codecs.lookup(encoding).name == 'utf-8'
+    if isinstance(source, str) and utf8:
+        with pa.OSFile(source) if spool else pa.memory_map(source) as stream:
+            yield stream
+        return
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with tempfile.TemporaryDirectory() if spool else contextlib.nullcontext() as directory:
+        spooled = os.path.join(directory, 'source.csv') if spool else None
+        text = pa.OSFile(spooled, 'wb') if spool else pa.BufferOutputStream()
+        with open(source, 'rb') if isinstance(source, str) else contextlib.nullcontext(source) as stream:
+            for block in iter(lambda: stream.read(1 << 20 if spool else 1 << 24), b''):
+                text.write(block if utf8 else decoder.decode(block).encode('utf-8'))
+        if not utf8:
+            text.write(decoder.decode(b'', final=True).encode('utf-8'))
+        if spool:
+            text.close()
+        with pa.OSFile(spooled) if spool else pa.BufferReader(text.getvalue()) as stream:
+            yield stream
+
+def header(stream, sep):
+    line = stream.read(1 << 16).split(b'\n', 1)[0]
+    stream.seek(0)
+    return next(csv.reader([line.decode('utf-8').lstrip('\ufeff').rstrip('\r')], delimiter=sep))
+
+def to_pandas(table, start=0):
+    # rows are numbered on from start like the chunks of read_csv, and a slice of a batch keeps the whole batch's
+    # dictionary, so categoricals drop the values they don't hold
+    data = table.to_pandas()
+    data.index = pd.RangeIndex(start, start+len(data))
+    for col in data.columns:
+        if isinstance(data[col].dtype, pd.CategoricalDtype):
+            values = data[col].cat.remove_unused_categories()
+            data[col] = values.cat.reorder_categories(values.cat.categories.sort_values())
+    return data
+
+def arrow_options(stream, sep, schema, dtype):
+    import pyarrow.csv as pc
+    types = {col: arrow_type(str) for col in header(stream, sep)}
+    for col, col_type in {**(schema or dict()), **(dtype or dict())}.items():
+        if col in types:
+            types[col] = arrow_type(col_type)
+    return dict(read_options=pc.ReadOptions(use_threads=True),
+                parse_options=pc.ParseOptions(delimiter=sep),
+                convert_options=pc.ConvertOptions(column_types=types, null_values=NA_VALUES, strings_can_be_null=True))
+
+def read_arrow(source, sep, encoding='utf-8', schema=None, dtype=None, chunksize=None):
+    # source is a path or a binary file, with a chunksize the frames come from a generator like read_csv's chunks
+    if chunksize is not None:
+        return read_arrow_chunks(source, sep, encoding, schema, dtype, chunksize)
+    import pyarrow as pa
+    import pyarrow.csv as pc
+    with arrow_input(source, encoding) as stream:
+        try:
+            table = pc.read_csv(stream, **arrow_options(stream, sep, schema, dtype))
+        except pa.ArrowInvalid as error:
+            raise SchemaMismatch(str(error)) from error
+    return to_pandas(table)
+
+def read_arrow_chunks(source, sep, encoding, schema, dtype, chunksize):
+    import pyarrow as pa
+    import pyarrow.csv as pc
+    with arrow_input(source, encoding, spool=True) as stream:
+        try:
+            reader = pc.open_csv(stream, **arrow_options(stream, sep, schema, dtype))
+            # the reader's batches are cut by bytes, they are regrouped into chunks of chunksize rows
+            table, start = reader.schema.empty_table(), 0
+            for batch in reader:
+                table = pa.concat_tables([table, pa.Table.from_batches([batch])])
+                while len(table) >= chunksize:
+                    yield to_pandas(table.slice(0, chunksize), start)
+                    table, start = table.slice(chunksize), start + chunksize
+        except pa.ArrowInvalid as error:
+            raise SchemaMismatch(str(error)) from error
+    if len(table):
+        yield to_pandas(table, start)
+
+SEPARATORS = re.compile(r'[\s,]*')
+
+def json_record_blocks(stream, block_size=1 << 20):
+    # the objects of a JSON array in a text stream, a list of them per block read, so neither the text nor the
+    # decoded array is ever held whole. A block's whole records are decoded in one go, up to its last '}', and one
+    # at a time when that '}' closes something inside a record rather than the record
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while not buffer:
+        block = stream.read(block_size)
+        buffer = block.lstrip()
+        if not block:
+            break
+    if not buffer.startswith('['):
+        raise ValueError(f'expected a JSON array, found {buffer[:20]!r}')
+    buffer = buffer[1:]
+    while True:
+        block = stream.read(block_size)
+        end_of_stream = not block
+        buffer = buffer[SEPARATORS.match(buffer).end():] + block
+        cut = buffer.rfind('}') + 1
+        try:
+            records = json.loads('[' + buffer[:cut] + ']')
+            buffer = buffer[cut:]
+        except json.JSONDecodeError:
+            records, position = [], 0
+            while True:
+                position = SEPARATORS.match(buffer, position).end()
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                records.append(record)
+            buffer = buffer[position:]
+        if records:
+            yield records
+        buffer = buffer[SEPARATORS.match(buffer).end():]
+        if buffer.startswith(']'):
+            return
+        if end_of_stream:
+            raise ValueError('the JSON array ends before its closing ]' if not buffer else
+                                f'a record of the JSON array is not valid JSON: {buffer[:80]!r}')
+
+def json_frame(rows, usecols):
+    # the text columns of a batch are made strings as soon as it is read, with None and '' left missing like read_csv
+    data = pd.DataFrame.from_records(rows, columns=usecols)
+    for col in usecols:
+        values = data[col].astype(str).where(data[col].notna())
+        data[col] = values.mask(values == '')
+    return data
+
+def read_json_records(source, names, usecols, schema=None, encoding='utf-8', batch_size=1 << 16):
+    # a JSON array of records to a DataFrame, read batch_size records at a time. Each record's values are named by
+    # their position with names, in the key order of the first record, usecols are kept and schema types them,
+    # a column that doesn't fit its type is read as read_csv would. Every other column is text
+    schema = schema or dict()
+    frames, rows, keys = [], [], None
+    with open(source, encoding=encoding) if isinstance(source, str) \
+            else io.TextIOWrapper(source, encoding=encoding) as stream:
+        for records in json_record_blocks(stream):
+            if keys is None:
+                keys = dict(zip(names, records[0]))
+                values = operator.itemgetter(*[keys[col] for col in usecols])
+            try:
+                block = list(map(values, records))
+            except KeyError:
+                # a record without some of the fields has them missing
+                block = [tuple(record.get(keys[col]) for col in usecols) for record in records]
+            rows.extend(block)
+            if len(rows) >= batch_size:
+                frames.append(json_frame(rows, usecols))
+                rows = []
+    frames.append(json_frame(rows, usecols))
+    data = pd.concat(frames, ignore_index=True)
+    for col, dtype in schema.items():
+        if col in data.columns:
+            try:
+                data[col] = data[col].astype(dtype)
+            except (ValueError, TypeError):
+                # as read_csv would read it, numbers with missing values are floats and anything else is text
+                try:
+                    data[col] = pd.to_numeric(data[col]).astype('float64')
+                except (ValueError, TypeError):
+                    pass
+    return data
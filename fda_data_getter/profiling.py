@@ -0,0 +1,100 @@
+'''
+Per-stage instrumentation for Transformer.etl.
+Every extract, transform and load is timed (wall and CPU), with the rows it left and the change in resident memory.
+With profiling on, the extract and load stages also note the bytes their frame holds.
+Stages that run more than once, like the chunks of a chunked run, are added up under one name.
+CPU time and memory are the process's, so for transforms running side by side they include each other's work.
+With profiling on, each etl writes a JSON report to profiles/, and 'cprofile' also dumps cProfile stats next to it.
+'''
+
+import os
+import json
+import time
+import cProfile
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+def rss():
+    # current resident memory in bytes, None where it can't be read
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+class Profiler():
+    def __init__(self, name, mode=None, path='profiles/'):
+        self.name = name
+        self.mode = mode
+        self.path = path
+        self.stages = dict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # locks can't be pickled, transformers carrying a profiler are sent to worker processes
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        # the caller sets record['rows'] once it knows them
+        record = {'rows': None}
+        memory, wall, cpu = rss(), time.perf_counter(), time.process_time()
+        yield record
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        memory = None if memory is None else rss() - memory
+        with self.lock:
+            self._add(name, record['rows'], wall, cpu, memory)
+
+    def _add(self, name, rows, wall, cpu, memory):
+        total = self.stages.setdefault(name, {'stage': name, 'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'memory_delta': 0})
+        total['calls'] += 1
+        total['wall'] += wall
+        total['cpu'] += cpu
+        total['rows'] = None if rows is None else total['rows'] + rows
+        total['memory_delta'] = None if memory is None or total['memory_delta'] is None else total['memory_delta'] + memory
+
+    def note(self, name, key, value):
+        # a figure measured outside a stage's timing, like the memory its frame holds, summed over the stage's calls
+        if value is None:
+            return
+        with self.lock:
+            total = self.stages[name]
+            total[key] = total.get(key, 0) + value
+
+    @contextmanager
+    def run(self, **details):
+        # times the whole etl and writes the report when profiling is on, details are added to it as they are
+        started = datetime.utcnow()
+        wall, cpu = time.perf_counter(), time.process_time()
+        profile = cProfile.Profile() if self.mode == 'cprofile' else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield self
+        finally:
+            if profile is not None:
+                profile.disable()
+        if self.mode is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        report_path = os.path.join(self.path, f'{self.name}_{started:%Y%m%d_%H%M%S}')
+        report = {'name': self.name, **details, 'started': started.isoformat(),
+                    'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu, 'rss': rss(),
+                    'stages': list(self.stages.values())}
+        with open(report_path+'.json', 'w') as report_file:
+            json.dump(report, report_file, indent=1)
+        if profile is not None:
+            profile.dump_stats(report_path+'.prof')
+        print(f'profile written to {report_path}.json')
@@ -10,60 +10,117 @@ This data can be downloaded in a variety of formats, excel, CSV, PDF
 '''
 
 
-import requests
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import os
 import pandas as pd
-from .transformer import Transformer
+from .transformer import Transformer, transform
+from .fetch import Fetcher
+from .parsers import read_json_records
+from .links import application, link_frame
+
+PURPLE_BOOK_URL = 'https://purplebooksearch.fda.gov'
+PB_DATE = '%m/%d/%Y'
+# the fields of a patent list record, by their position in it
+PATENT_LIST_COLUMNS = ['id', 'Reference Product BLA Number', 'Applicant', 'Proprietary Name', 'Proper Name', 'Patent Number',
+                        'Text Patent Expiration Date', 'created_at', 'updated_at']
 
 class PurpleBook():
-    def __init__(self, raw_data_path = 'raw_data/', format='xlsx'):
+    # months back from this one searched for the latest biologics extract
+    month_window = 6
+
+    def __init__(self, raw_data_path = 'raw_data/', format='xlsx', 
+                        purple_book_url = PURPLE_BOOK_URL, fetcher = None, profile = None,
+                        keep_patent_list = True):
+        self.purple_book_url = purple_book_url
+        # the patent list's JSON is kept in raw_data for audit, without it it's deleted once it's processed
+        self.keep_patent_list = keep_patent_list
+        self.profile = profile
         self.raw_data_path = raw_data_path
         self.format = format
+        self.fetcher = fetcher or Fetcher()
+        self.changed = True
+        self.patent_list_url = f'{purple_book_url}/api/v1/patent-list'
+        # the biologics extract's month is only known once it's found
+        self.biologics_url = None
         
-    def _get_biologics(self):
-        def find_date(date):
-            date = date.replace(day=1)
-            year = date.strftime('%Y')
+    def _month_urls(self, date):
+        # the extract url of this month and of each month before it in the window, newest first
+        urls = []
+        date = date.replace(day=1)
+        for _ in range(self.month_window):
             month = date.strftime('%B').lower()
-            url = f'https://purplebooksearch.fda.gov/files/{year}/purplebook-search-{month}-data-download.csv'
-            response = requests.get(url)
-            data = response.content
-            if data[:15] == b'<!DOCTYPE html>':
-                date = date - timedelta(days=1)
-                return find_date(date)
-            else:
-                return data
-        data = find_date(datetime.utcnow())
-        with open(self.raw_data_path+'purple_book_database_extract.csv', 'wb') as csv_file:
-            csv_file.write(data)
+            urls.append(f'{self.purple_book_url}/files/{date:%Y}/purplebook-search-{month}-data-download.csv')
+            date = (date - timedelta(days=1)).replace(day=1)
+        return urls
+
+    def _is_extract(self, url):
+        # months that aren't published yet are served as the site's html page
+        status, start = self.fetcher.peek(url, 15)
+        return status in (200, 206) and start != b'<!DOCTYPE html>'
+
+    def _find_biologics_url(self):
+        # the newest published month, only months after the last one downloaded are probed, all at once
+        urls = self._month_urls(datetime.utcnow())
+        cache = self.fetcher.cache
+        known = next((url for url in urls if cache is not None and url in cache.entries), None)
+        probe = urls[:urls.index(known)] if known else urls
+        if probe:
+            with ThreadPoolExecutor(max_workers=len(probe)) as pool:
+                published = list(pool.map(self._is_extract, probe))
+            found = [url for url, is_extract in zip(probe, published) if is_extract]
+            if found:
+                return found[0]
+        if known is None:
+            raise RuntimeError(f'no purple book extract in the last {self.month_window} months at {self.purple_book_url}')
+        return known
+
+    def _get_biologics(self):
+        path = self.raw_data_path+'purple_book_database_extract.csv'
+        self.biologics_url = self._find_biologics_url()
+        return self.fetcher.download(self.biologics_url, path)
 
     def _get_purple_patents(self):
-        response = requests.get('https://purplebooksearch.fda.gov/api/v1/patent-list').json()
-        data = pd.DataFrame(response)
-        data.columns = ['id', 'Reference Product BLA Number', 'Applicant', 'Proprietary Name', 
-            'Proper Name', 'Patent Number', 'Text Patent Expiration Date','created_at', 
-            'updated_at']
-        data = data[['Reference Product BLA Number', 'Applicant', 'Proprietary Name', 
-            'Proper Name', 'Patent Number', 'Text Patent Expiration Date']]
-        data.to_csv(self.raw_data_path+'purple_patent.csv', index=False)
+        # the API's JSON is streamed to disk as it arrives, PurplePatents parses it from there
+        path = self.raw_data_path+'patent_list.json'
+        return self.fetcher.download(self.patent_list_url, path)
 
     def _get_data(self):
         print('   getting biologics data')
-        self._get_biologics()
         print('   getting patents data')
-        self._get_purple_patents()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(self._get_biologics), pool.submit(self._get_purple_patents)]
+            return any([future.result() for future in futures])
 
-    def get_book(self):
+    @property
+    def urls(self):
+        return [url for url in (self.biologics_url, self.patent_list_url) if url is not None]
+
+    def fetch(self):
+        print('getting purple book data')
+        self.changed = self._get_data()
+
+    def process(self):
         print('processing purple book data')
-        self._get_data()
         print('processing biologics data')
         biologics = BiologicalDrugs('purple_book_database_extract.csv', self.raw_data_path, self.format)
-        biologics.etl(biologics.name)
+        biologics.etl(biologics.name, profile=self.profile)
         print('processing biologics patent data')
-        purple_patents = PurplePatents('purple_patent.csv', self.raw_data_path, self.format)
-        purple_patents.etl(purple_patents.name)
+        purple_patents = PurplePatents('patent_list.json', self.raw_data_path, self.format)
+        purple_patents.etl(purple_patents.name, profile=self.profile)
+        if not self.keep_patent_list:
+            # the next fetch downloads it whole again, the parse cache still has it if it's unchanged
+            os.remove(purple_patents.raw_data)
+
+    def get_book(self):
+        self.fetch()
+        self.process()
 
 class BiologicalDrugs(Transformer):
+    indexes = [['BLA Number']]
+    categories = ['N/R/U', 'Applicant', 'BLA Type', 'Strength', 'Dosage Form', 'Route of Administration',
+                    'Product Presentation', 'Status', 'Licensure', 'Submission Type', 'Center']
+
     def __init__(self, raw_file, raw_data_path = 'raw_data/', format='xlsx'):
         self.name = 'PB'
         self.raw_data = raw_data_path + raw_file
@@ -108,110 +165,104 @@ class BiologicalDrugs(Transformer):
                                             'Text_Orphan Exclusivity Exp Date'])
 
     def _extract(self):
-        data = pd.read_csv(self.source_data)
+        with self.source() as source:
+            data = pd.read_csv(source)
         start = data.index[data[data.columns[0]] == 'Purple Book Database Extract'].to_list()[0]+1
         columns = data.iloc[start]
         data = data.iloc[start+1:len(data)]
         data.columns = columns
-        return data
+        # the header is only found after reading, so the categories are converted rather than read as such
+        return data.astype({col: dtype for col, dtype in self.source_dtypes().items() if col in data.columns})
 
+    @transform(inputs=['Date of First Licensure', 'Orphan Exclusivity Exp. Date', 'First Interchangeable Exclusivity Exp. Date',
+                        'Exclusivity Expiration Date', 'Approval Date', 'Ref. Product Exclusivity Exp. Date'],
+                outputs=['Entity_Date of First Licensure', 'Entity_Orphan Exclusivity Exp Date',
+                        'First Interchangeable Exclusivity Exp Date', 'Entity_Exclusivity Expiration Date',
+                        'Entity_Approval Date', 'Entity_Ref Product Exclusivity Exp Date'])
     def _transform_dates(self):
-        self.data['Text_Entity_Date of First Licensure'] = self.date_formula(self.data['Date of First Licensure'])
-        self.data['Entity_Date of First Licensure'] = self.data['Date of First Licensure']
-        #
-        self.data['Text_Orphan Exclusivity Exp Date'] = self.date_formula(self.data['Orphan Exclusivity Exp. Date'])
-        self.data['Entity_Orphan Exclusivity Exp Date'] = self.data['Orphan Exclusivity Exp. Date']
-        #
-        self.data['Text_First Interchangeable Exclusivity Exp Date'] = self.date_formula(self.data['First Interchangeable Exclusivity Exp. Date'])
-        self.data['First Interchangeable Exclusivity Exp Date'] = self.data['First Interchangeable Exclusivity Exp. Date']
-        #
-        self.data['Text_Exclusivity Expiration Date'] = self.date_formula(self.data['Exclusivity Expiration Date'])
-        self.data['Entity_Exclusivity Expiration Date'] = self.data['Exclusivity Expiration Date']
-        #
-        self.data['Entity_Approval Date'] = self.data['Approval Date']
-        self.data['Text_Approval Date'] = self.date_formula(self.data['Approval Date'])
-        #
-        self.data['Entity_Ref Product Exclusivity Exp Date'] = self.data['Ref. Product Exclusivity Exp. Date']
-        self.data['Text_Ref Product Exclusivity Exp Date'] = self.date_formula(self.data['Ref. Product Exclusivity Exp. Date'])
+        return {'Entity_Date of First Licensure': self.data['Date of First Licensure'],
+                'Entity_Orphan Exclusivity Exp Date': self.data['Orphan Exclusivity Exp. Date'],
+                'First Interchangeable Exclusivity Exp Date': self.data['First Interchangeable Exclusivity Exp. Date'],
+                'Entity_Exclusivity Expiration Date': self.data['Exclusivity Expiration Date'],
+                'Entity_Approval Date': self.data['Approval Date'],
+                'Entity_Ref Product Exclusivity Exp Date': self.data['Ref. Product Exclusivity Exp. Date']}
+
+    @transform(inputs=['Date of First Licensure', 'Orphan Exclusivity Exp. Date', 'First Interchangeable Exclusivity Exp. Date',
+                        'Exclusivity Expiration Date', 'Approval Date', 'Ref. Product Exclusivity Exp. Date'],
+                outputs=['Text_Entity_Date of First Licensure', 'Text_Orphan Exclusivity Exp Date',
+                        'Text_First Interchangeable Exclusivity Exp Date', 'Text_Exclusivity Expiration Date',
+                        'Text_Approval Date', 'Text_Ref Product Exclusivity Exp Date'], per_format=True)
+    def _transform_text_dates(self):
+        return {'Text_Entity_Date of First Licensure': self.text_dates('Date of First Licensure', PB_DATE),
+                'Text_Orphan Exclusivity Exp Date': self.text_dates('Orphan Exclusivity Exp. Date', PB_DATE),
+                'Text_First Interchangeable Exclusivity Exp Date': self.text_dates('First Interchangeable Exclusivity Exp. Date', PB_DATE),
+                'Text_Exclusivity Expiration Date': self.text_dates('Exclusivity Expiration Date', PB_DATE),
+                'Text_Approval Date': self.text_dates('Approval Date', PB_DATE),
+                'Text_Ref Product Exclusivity Exp Date': self.text_dates('Ref. Product Exclusivity Exp. Date', PB_DATE)}
+
+    def product_number(self):
+        return self.data['Product Number'].astype(int).astype(str)
 
+    def _link_frame(self, data):
+        return link_frame(application('BLA', data['BLA Number']), self.name, data['Product Number'], data['Proprietary Name'])
+
+    @transform(inputs=['Product Number'], outputs=['Product Number'])
     def _transform_product_number(self):
-        self.data['Product Number'] = self.data['Product Number'].apply(lambda row: int(row))
+        return {'Product Number': self.data['Product Number'].astype(int)}
 
+    @transform(inputs=['Proper Name'], outputs=['Entity_NonProp Name'])
     def _transform_entity_nonprop_name(self):
-        def entity_nonprop_name(row):
-            name = '' if row['Proper Name']!=row['Proper Name'] else row['Proper Name'].upper()
-            return f'{name} (NonProp Name)'
-        self.data['Entity_NonProp Name'] = self.data.apply(entity_nonprop_name, axis=1)
+        return {'Entity_NonProp Name': self.concat(self.upper('Proper Name'), ' (NonProp Name)')}
 
+    @transform(inputs=['Proper Name'], outputs=['Proper Name'])
     def _transform_proper_name(self):
-        def proper_name(row):
-            name = '' if row['Proper Name']!=row['Proper Name'] else row['Proper Name'].upper()
-            return name
-        self.data['Proper Name'] = self.data.apply(proper_name, axis=1)
+        return {'Proper Name': self.upper('Proper Name')}
 
+    @transform(outputs=['Source'])
     def _transform_source(self):
-        self.data['Source'] = 'FDA Purple Book'
+        return {'Source': 'FDA Purple Book'}
 
+    @transform(inputs=['Ref. Product Proprietary Name'], outputs=['Ref Product Proprietary Name'])
     def _transform_ref_product_proprietary_name(self):
-        def ref_product_proprietary_name(row):
-            return 'N/A' if row['Ref. Product Proprietary Name']!=row['Ref. Product Proprietary Name'] else row['Ref. Product Proprietary Name'].upper()
-        self.data['Ref Product Proprietary Name'] = self.data.apply(ref_product_proprietary_name, axis=1)
+        return {'Ref Product Proprietary Name': self.upper('Ref. Product Proprietary Name', na='N/A')}
 
+    @transform(inputs=['Proprietary Name'], outputs=['Entity_Trade Name'])
     def _transform_entity_trade_name(self):
-        def entity_trade_name(row):
-            name = '' if row['Proprietary Name'] != row['Proprietary Name'] else row['Proprietary Name'].upper()
-            return f'{name} (Trade Name)'
-        self.data['Entity_Trade Name'] = self.data.apply(entity_trade_name, axis=1)
-
-    def _transform_propreitary_name(self):
-        def propreitary_name(row):
-            return '' if row['Proprietary Name'] != row['Proprietary Name'] else row['Proprietary Name'].upper()
-        self.data['Propreitary Name'] = self.data.apply(propreitary_name, axis=1)
+        return {'Entity_Trade Name': self.concat(self.upper('Proprietary Name'), ' (Trade Name)')}
 
+    @transform(inputs=['Orphan Exclusivity Exp. Date', 'Proprietary Name', 'BLA Number', 'Product Number'],
+                outputs=['Entity_Orph Excl_Combined'])
     def _transform_entity_orph_excl_combined(self):
-        def entity_orph_excl_combined(row):
-            name = '' if row['Proprietary Name'] != row['Proprietary Name'] else row['Proprietary Name'].upper()
-            bla = row['BLA Number']
-            pr = int(row['Product Number'])
-            date = '' if row['Orphan Exclusivity Exp. Date'] != row['Orphan Exclusivity Exp. Date'] else row['Orphan Exclusivity Exp. Date']
-            return f'Orph Excl Date {name} BLA#{bla}PR#{pr}-{date}'
-        self.data['Entity_Orph Excl_Combined'] = self.data.apply(entity_orph_excl_combined, axis=1)
+        date = self.data['Orphan Exclusivity Exp. Date'].fillna('')
+        return {'Entity_Orph Excl_Combined': self.concat('Orph Excl Date ', self.upper('Proprietary Name'), 
+                                                    ' BLA#', self.text('BLA Number'), 'PR#', self.product_number(), '-', date)}
 
+    @transform(inputs=['Applicant'], outputs=['Entity_Applicant'])
     def _transform_entity_applicant(self):
-        def entity_applicant(row):
-            return '' if row['Applicant']!=row['Applicant'] else row['Applicant'].upper().replace('.','')
-        self.data['Entity_Applicant'] = self.data.apply(entity_applicant, axis=1)
+        return {'Entity_Applicant': self.upper('Applicant').str.replace('.', '', regex=False)}
 
+    @transform(inputs=['BLA Number', 'Product Number'], outputs=['Entity_BLA#PR#'])
     def _transform_entity_bla_pr_(self):
-        def entity_bla_pr_(row):
-            bla = row['BLA Number']
-            pr = int(row['Product Number'])
-            return f'BLA#{bla}PR#{pr}'
-        self.data['Entity_BLA#PR#'] = self.data.apply(entity_bla_pr_, axis=1)
+        return {'Entity_BLA#PR#': self.concat('BLA#', self.text('BLA Number'), 'PR#', self.product_number())}
 
+    @transform(inputs=['Proprietary Name', 'BLA Number', 'Product Number'], outputs=['Entity_Trade Name_BLA#PR#.1'])
     def _transform_entity_trade_name_bla_pr__1(self):
-        def entity_trade_name_bla_pr__1(row):
-            name = '' if row['Proprietary Name'] != row['Proprietary Name'] else row['Proprietary Name'].upper()
-            bla = row['BLA Number']
-            pr = int(row['Product Number'])
-            return f'{name} BLA#{bla}PR#{pr}'
-        self.data['Entity_Trade Name_BLA#PR#.1'] = self.data.apply(entity_trade_name_bla_pr__1, axis=1)
+        return {'Entity_Trade Name_BLA#PR#.1': self.concat(self.upper('Proprietary Name'), ' BLA#', self.text('BLA Number'), 
+                                                        'PR#', self.product_number())}
 
+    @transform(inputs=['Ref. Product Proper Name'], outputs=['Ref Product Proper Name'])
     def _transform_ref_product_proper_name(self):
-        def ref_product_proper_name(row):
-            return 'N/A' if row['Ref. Product Proper Name']!=row['Ref. Product Proper Name'] else row['Ref. Product Proper Name'].upper()
-        self.data['Ref Product Proper Name'] = self.data.apply(ref_product_proper_name, axis=1)
+        return {'Ref Product Proper Name': self.upper('Ref. Product Proper Name', na='N/A')}
 
+    @transform(inputs=['Proprietary Name', 'BLA Number', 'Product Number'], outputs=['Entity_Appr Date_Combined'])
     def _transform_entity_appr_date_combined(self):
-        def entity_appr_date_combined(row):
-            name = '' if row['Proprietary Name'] != row['Proprietary Name'] else row['Proprietary Name'].upper()
-            bla = row['BLA Number']
-            pr = int(row['Product Number'])
-            date = '' if row['Approval Date']!=row['Approval Date'] else ''
-            return f'Appr Date {name} BLA#{bla}PR#{pr}-{date}'
-        self.data['Entity_Appr Date_Combined'] = self.data.apply(entity_appr_date_combined, axis=1)
+        return {'Entity_Appr Date_Combined': self.concat('Appr Date ', self.upper('Proprietary Name'), 
+                                                    ' BLA#', self.text('BLA Number'), 'PR#', self.product_number(), '-')}
 
 class PurplePatents(Transformer):
+    indexes = [['Reference Product BLA Number'], ['Patent Number']]
+    schema = {'Reference Product BLA Number': 'int64'}
+
     def __init__(self, raw_file, raw_data_path = 'raw_data/', format='xlsx'):
             self.name = 'PBPat'
             self.raw_data = raw_data_path + raw_file
@@ -222,55 +273,47 @@ class PurplePatents(Transformer):
                                 'Entity_Non Prop Name', 'Column9', 'Proper Name', 'Column11', 
                                 'Patent Number', 'Entity_Trade Name_Pat#_ Exp Date', 
                                 'Text Patent Expiration Date'])
-        
+
     def _extract(self):
+        # the patent list is a JSON array of records, decoded as it is read and never held whole
         print(f'extracting {self.source_data}')
-        return pd.read_csv(self.source_data)
+        return read_json_records(self.source_data, PATENT_LIST_COLUMNS, PATENT_LIST_COLUMNS[1:-2], self.schema)
 
-    def _transform_zdate(self):
-        self.data['Text Patent Expiration Date']=self.date_formula(self.data['Text Patent Expiration Date'])
+    @transform(inputs=['Text Patent Expiration Date'], outputs=['Text Patent Expiration Date'], per_format=True)
+    def _transform_text_patent_expiration_date(self):
+        return {'Text Patent Expiration Date': self.text_dates('Text Patent Expiration Date', '%Y-%m-%d')}
 
+    @transform(inputs=['Proprietary Name'], outputs=['Entity_Trade Name'])
     def _transform_entity_trade_name(self):
-        def entity_trade_name(row):
-            trade_name = '' if row['Proprietary Name']!=row['Proprietary Name'] else row['Proprietary Name'].upper()
-            return f'{trade_name} (Trade Name)'
-        self.data['Entity_Trade Name'] = self.data.apply(entity_trade_name, axis=1)
+        return {'Entity_Trade Name': self.concat(self.upper('Proprietary Name'), ' (Trade Name)')}
     
+    @transform(inputs=['Proprietary Name', 'Patent Number', 'Text Patent Expiration Date'],
+                outputs=['Entity_Trade Name_Pat#_ Exp Date'])
     def _transform_entity_trade_name_pat___exp_date(self):
-        def entity_trade_name_pat___exp_date(row):
-            trade_name = '' if row['Proprietary Name']!=row['Proprietary Name'] else row['Proprietary Name'].upper()
-            patent = row['Patent Number'].replace(',','')
-            date = '' if row['Text Patent Expiration Date']!= row['Text Patent Expiration Date'] else datetime.strptime(row['Text Patent Expiration Date'],'%Y-%m-%d').strftime('%m/%d/%Y')
-            return f'{trade_name} Pat#{patent} Patent Exp Date {date}'
-        self.data['Entity_Trade Name_Pat#_ Exp Date'] = self.data.apply(entity_trade_name_pat___exp_date, axis=1)
+        patent = self.data['Patent Number'].str.replace(',', '', regex=False)
+        date = self.format_dates('Text Patent Expiration Date', '%Y-%m-%d', '%m/%d/%Y', na='')
+        return {'Entity_Trade Name_Pat#_ Exp Date': self.concat(self.upper('Proprietary Name'), ' Pat#', patent, 
+                                                            ' Patent Exp Date ', date)}
         
+    @transform(inputs=['Reference Product BLA Number'], outputs=['Entity_BLA#'])
     def _transform_entity_bla_(self):
-        def entity_bla_(row):
-            bla = row['Reference Product BLA Number']
-            return f'BLA#{bla}'
-        self.data['Entity_BLA#'] = self.data.apply(entity_bla_, axis=1)
+        return {'Entity_BLA#': self.concat('BLA#', self.text('Reference Product BLA Number'))}
         
+    @transform(inputs=['Proper Name'], outputs=['Entity_Non Prop Name'])
     def _transform_entity_non_prop_name_(self):
-        def entity_non_prop_name_(row):
-            name = '' if row['Proper Name']!= row['Proper Name'] else row['Proper Name'].upper()
-            return f'{name} (NonProp Name)'
-        self.data['Entity_Non Prop Name'] = self.data.apply(entity_non_prop_name_, axis=1)
+        return {'Entity_Non Prop Name': self.concat(self.upper('Proper Name'), ' (NonProp Name)')}
         
+    @transform(inputs=['Proper Name'], outputs=['Column9'])
     def _transform_column9(self):
-        def proper_name(row):
-            return '' if row['Proper Name']!=row['Proper Name'] else row['Proper Name'].upper()
-        self.data['Column9'] = self.data.apply(proper_name, axis=1)
+        return {'Column9': self.upper('Proper Name')}
         
+    @transform(inputs=['Proprietary Name', 'Patent Number'], outputs=['Column11', 'Patent Number'])
     def _transform_column11(self):
-        def column11(row):
-            name = '' if row['Proprietary Name']!=row['Proprietary Name'] else row['Proprietary Name'].upper()
-            pat = row['Patent Number'].replace(',','')
-            return f'{name} Pat#{pat}'
-        self.data['Column11'] = self.data.apply(column11, axis=1)
-        self.data['Patent Number'] = self.data['Patent Number'].apply(lambda row: row.replace(',',''))
+        patent = self.data['Patent Number'].str.replace(',', '', regex=False)
+        return {'Patent Number': patent,
+                'Column11': self.concat(self.upper('Proprietary Name'), ' Pat#', patent)}
         
+    @transform(inputs=['Applicant'], outputs=['Entity_Applicant', 'Applicant'])
     def _transform_entity_applicant(self):
-        def applicant(row):
-            return '' if row['Applicant']!=row['Applicant'] else row['Applicant'].upper().replace('.','')
-        self.data['Entity_Applicant'] = self.data.apply(applicant, axis=1)
-        self.data['Applicant']=self.data['Applicant'].apply(lambda row: row.replace('.',''))
\ No newline at end of file
+        return {'Entity_Applicant': self.upper('Applicant').str.replace('.', '', regex=False),
+                'Applicant': self.data['Applicant'].str.replace('.', '', regex=False)}
@@ -0,0 +1,127 @@
+'''
+Looks rows up in the sqlite output of 'python main.py sqlite'.
+Every book's database in the finished data directory is attached to one connection, so a query can name
+any book's table, or join them, without saying which file it is in. Lookups use the indexes each transformer
+declares, and rows are printed tab separated under a header.
+Without sqlite output the link lookup searches the link rows every book saved in raw_data, in memory.
+
+python -m fda_data_getter.query tables
+python -m fda_data_getter.query application 20702
+python -m fda_data_getter.query patent 6412089
+python -m fda_data_getter.query bla 125057
+python -m fda_data_getter.query ndc 0002-1433
+python -m fda_data_getter.query labeler "Eli Lilly and Company"
+python -m fda_data_getter.query link NDA020702
+python -m fda_data_getter.query link 125057
+python -m fda_data_getter.query sql "SELECT Appl_No, Patent_No FROM OBPat WHERE Appl_No = 20702"
+'''
+
+import os
+import sys
+import re
+import csv
+import glob
+import sqlite3
+import argparse
+
+END_DATA = '\\finished data\\'
+
+# lookup name: the tables and indexed columns it searches
+LOOKUPS = {'application': [('OBProd', 'Appl_No'), ('OBExcl', 'Appl_No'), ('OBPat', 'Appl_No')],
+            'patent': [('OBPat', 'Patent_No'), ('PBPat', 'Patent Number')],
+            'bla': [('PB', 'BLA Number'), ('PBPat', 'Reference Product BLA Number')],
+            'ndc': [('NDC', 'PRODUCTNDC')],
+            'labeler': [('NDC', 'LABELERNAME')],
+            'link': [('Links', 'Application')]}
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def databases(path):
+    # table name: database file, each book's database is named after the one table in it
+    return {filename[len(path):-len('.sqlite')]: filename for filename in sorted(glob.glob(glob.escape(path) + '*.sqlite'))}
+
+def connect(path):
+    # every database is attached under its table's name, so unqualified table names find their book
+    found = databases(path)
+    if not found:
+        raise FileNotFoundError(f'no sqlite output under {path}, run \'python main.py sqlite\' first')
+    connection = sqlite3.connect(':memory:')
+    for table, filename in found.items():
+        connection.execute('ATTACH DATABASE ? AS ' + quote(table), (filename,))
+    return connection
+
+def print_rows(cursor, out=None):
+    writer = csv.writer(out or sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow([column[0] for column in cursor.description])
+    rows = 0
+    for row in cursor:
+        writer.writerow(['' if value is None else value for value in row])
+        rows += 1
+    return rows
+
+def tables(connection):
+    return [name for _, name, _ in connection.execute('PRAGMA database_list') if name not in ('main', 'temp')]
+
+def link_lookup(value):
+    # an application code like NDA020702 is looked up on the Application it normalizes to,
+    # a bare number on Application Number, which finds it in every kind of application
+    if value.strip().isdigit():
+        return [('Links', 'Application Number')], int(value)
+    code = re.fullmatch(r'\s*(NDA|ANDA|BLA)\s*(\d+)\s*', value.upper())
+    return LOOKUPS['link'], (code.group(1) + code.group(2).zfill(6) if code else value)
+
+def index_lookup(value, links_path=None, out=None):
+    # the link rows every book saved on its last run, looked up in a LinkIndex, pandas is only imported here
+    from .links import LinkIndex, link_table
+    out = out or sys.stdout
+    rows = LinkIndex(link_table(links_path)).find(value)
+    print('-- Links', file=out)
+    rows.to_csv(out, sep='\t', index=False, lineterminator='\n')
+    print(f'-- {len(rows)} rows\n', file=out)
+
+def lookup(connection, name, value, out=None):
+    out = out or sys.stdout
+    attached = tables(connection)
+    searched = LOOKUPS[name]
+    if name == 'link':
+        searched, value = link_lookup(value)
+    for table, column in searched:
+        if table not in attached:
+            continue
+        print(f'-- {table}', file=out)
+        cursor = connection.execute(f'SELECT * FROM {quote(table)}.{quote(table)} WHERE {quote(column)} = ?', (value,))
+        rows = print_rows(cursor, out)
+        print(f'-- {rows} rows\n', file=out)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='look rows up in the sqlite output')
+    parser.add_argument('--path', default=os.getcwd()+END_DATA, help='where main.py wrote the finished data')
+    parser.add_argument('--links-path', help='the link rows the books saved, searched by link without sqlite output '
+                                                '(default raw_data/links/)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('tables', help='the tables and their row counts')
+    for name, searched in LOOKUPS.items():
+        command = commands.add_parser(name, help='rows of ' + ', '.join(f'{table} by {column}' for table, column in searched))
+        command.add_argument('value')
+    command = commands.add_parser('sql', help='any sqlite query, every book\'s table can be named directly')
+    command.add_argument('query')
+    args = parser.parse_args(args)
+    if args.command == 'link' and 'Links' not in databases(args.path):
+        index_lookup(args.value, args.links_path)
+        return
+    connection = connect(args.path)
+    try:
+        if args.command == 'tables':
+            for table in tables(connection):
+                rows, = connection.execute(f'SELECT count(*) FROM {quote(table)}.{quote(table)}').fetchone()
+                print(f'{table}\t{rows}')
+        elif args.command == 'sql':
+            print_rows(connection.execute(args.query))
+        else:
+            lookup(connection, args.command, args.value)
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    main()
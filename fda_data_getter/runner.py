@@ -0,0 +1,45 @@
+'''
+Runs the processing step of several books, one book per worker process.
+Each book writes its output to its own log file and a book that fails does not stop the others.
+'''
+
+import os
+import sys
+import traceback
+from time import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+def run_book(book, log_dir='logs/'):
+    name = type(book).__name__
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, name+'.log')
+    error = None
+    start = time()
+    with open(log_path, 'w') as log, redirect_stdout(log):
+        try:
+            book.process()
+        except Exception:
+            error = traceback.format_exc()
+            print(error)
+        elapsed = time() - start
+        print(f'{name} finished in {round(elapsed, 1)} seconds')
+    return name, elapsed, error, log_path
+
+def run_books(books, jobs, log_dir='logs/'):
+    failed = []
+    sys.stdout.flush()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_book, book, log_dir): type(book).__name__ for book in books}
+        for future in as_completed(futures):
+            try:
+                name, elapsed, error, log_path = future.result()
+            except Exception:
+                # the worker itself died, e.g. out of memory
+                name, elapsed, error, log_path = futures[future], 0, traceback.format_exc(), None
+            if error is None:
+                print(f'\033[92m    {name} done in {round(elapsed/60, 1)} minutes, log in {log_path}\033[0m')
+            else:
+                print(f'\033[91m    {name} failed after {round(elapsed/60, 1)} minutes, log in {log_path}\033[0m')
+                failed.append(name)
+    return failed
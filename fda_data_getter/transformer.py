@@ -1,34 +1,359 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
+from contextlib import contextmanager, ExitStack
+from functools import partial
+import zipfile
+import itertools
 import os
+from .xlsx import write_xlsx
+from .writers import WRITERS
+from . import delta
+from .profiling import Profiler
+from .parse_cache import ParseCache, content_hash
+from .parsers import read_arrow, arrow_available, SchemaMismatch
+from .dag import transform, plan
+from .formats import FORMATS, COLUMNAR_FORMATS, UNMATCHED_POLICIES
+from concurrent.futures import ThreadPoolExecutor
+
+def common_dtype(first, second):
+    # the dtype a single read_csv would have given a column that two chunks read as first and second
+    if first == second:
+        return first
+    if pd.api.types.is_string_dtype(first) or pd.api.types.is_string_dtype(second):
+        return first if pd.api.types.is_string_dtype(first) else second
+    if pd.api.types.is_bool_dtype(first) or pd.api.types.is_bool_dtype(second):
+        return object
+    if pd.api.types.is_numeric_dtype(first) and pd.api.types.is_numeric_dtype(second):
+        return np.result_type(first, second)
+    return object
+
+def uncategorize_numbers(data, columns):
+    # a categorical read makes every value text, a column whose values are all numbers gets back the numbers
+    # read_csv would have inferred, floats when some are missing
+    for col in columns:
+        if col not in data.columns or not isinstance(data[col].dtype, pd.CategoricalDtype):
+            continue
+        try:
+            numbers = pd.Series(pd.to_numeric(data[col].cat.categories.to_numpy()))
+        except (ValueError, TypeError):
+            continue
+        data[col] = pd.Series(numbers.reindex(data[col].cat.codes.to_numpy()).to_numpy(), index=data.index)
+    return data
 
 class Transformer():
-    def __init__(self, source_data, end_data, final_columns, format):
+    # 'streaming' writes xlsx row chunks straight to disk, 'openpyxl' builds the workbook in memory with DataFrame.to_excel
+    xlsx_writer = 'streaming'
+    # natural keys of a source row, used by incremental runs to find what changed
+    keys = None
+    snapshot_path = 'snapshots/'
+    # each source's rows for the cross-book link table are saved here when it is loaded, see links.py
+    links_path = 'raw_data/links/'
+    # rows per chunk for transformers that stream their source, None reads it whole
+    chunksize = None
+    # low-cardinality source columns, read as categoricals so each distinct value is stored once
+    categories = ()
+    # parsed sources are cached here keyed on their raw bytes, None parses the source on every run
+    parse_cache_path = 'raw_data/parsed/'
+    # what join does with rows whose key is not in the table: 'raise', 'drop' them or leave the looked up values 'blank'
+    unmatched = 'raise'
+    # threads for the transforms of one level of the plan, they only read data so they can overlap
+    transform_workers = 1
+    # columns the sqlite output is looked up by, each entry is the columns of one index
+    indexes = ()
+    # an extraction of the source started by prefetch, etl waits for it rather than extracting again
+    prefetched = None
+    # 'arrow' reads sources with pyarrow's multi-threaded csv reader and 'pandas' with read_csv,
+    # arrow falls back to pandas when pyarrow isn't installed or the source doesn't fit schema
+    parser = 'arrow'
+    sep = '~'
+    encoding = 'utf-8'
+    # types of the source columns that aren't text, for the arrow parser, as read_csv would infer them
+    schema = dict()
+
+    def __init__(self, source_data, end_data, final_columns, format, archive=None):
+        # subclasses set unmatched before calling this, join would take any other value for 'blank'
+        if self.unmatched not in UNMATCHED_POLICIES:
+            raise ValueError(f'unmatched must be one of {", ".join(UNMATCHED_POLICIES)}, not {self.unmatched!r}')
         self.source_data = source_data
+        self.archive = archive
         self.final_columns = final_columns
         self.data = []
         self.end_data = end_data
-        self.format=format
+        # format is a format or a list of them, every transform but the per format ones runs once for all of them
+        self.formats = [format] if isinstance(format, str) else list(format)
+        self.format = self.formats[0]
+        self.date_cache = dict()
+        self.join_cache = dict()
+        self.profiler = Profiler(type(self).__name__)
     
+    @contextmanager
+    def source(self):
+        # source_data is a path, or the name of a member of archive when one is given
+        if self.archive is None:
+            yield self.source_data
+        else:
+            with zipfile.ZipFile(self.archive) as archive, archive.open(self.source_data) as member:
+                yield member
+
+    def parser_backend(self):
+        return 'arrow' if self.parser == 'arrow' and arrow_available() else 'pandas'
+
+    def read(self, source, **kwargs):
+        if self.parser_backend() == 'arrow':
+            return read_arrow(source, self.sep, self.encoding, self.schema, **kwargs)
+        return pd.read_csv(source, sep=self.sep, encoding=self.encoding, **kwargs)
+
+    def _fall_back(self, error):
+        print(f'    {self.source_data} does not fit its schema, reading it with pandas: {error}')
+        self.parser = 'pandas'
+
+    def source_dtypes(self, dtype=None):
+        # dtype with the categories columns made categorical, columns the source doesn't have are ignored.
+        # Only text is made categorical, a column dtype already gives as numbers keeps them
+        dtypes = dict(dtype or dict())
+        dtypes.update({col: 'category' for col in self.categories if pd.api.types.is_string_dtype(dtypes.get(col, str))})
+        return dtypes
+
     def _extract(self):
         print(f'extracting {self.source_data}')
-        return pd.read_csv(self.source_data, sep='~')
+        try:
+            with self.source() as source:
+                data = self.read(source, dtype=self.source_dtypes())
+        except SchemaMismatch as error:
+            self._fall_back(error)
+            with self.source() as source:
+                data = self.read(source, dtype=self.source_dtypes())
+        return uncategorize_numbers(data, self.categories)
+
+    def _extract_chunks(self, dtype=None):
+        with self.source() as source:
+            yield from self.read(source, chunksize=self.chunksize, dtype=dtype)
+
+    def raw_hash(self):
+        with self.source() as source:
+            if isinstance(source, str):
+                with open(source, 'rb') as raw:
+                    return content_hash(raw)
+            return content_hash(source)
+
+    def _cached_extract(self):
+        # a source whose raw bytes were parsed before is loaded from the parse cache instead
+        if self.parse_cache_path is None:
+            return self._extract()
+        cache = ParseCache(self.parse_cache_path, f'{type(self).__name__}_{os.path.basename(self.source_data)}')
+        key = cache.key(self.raw_hash(), sorted(self.categories), self.parser_backend(), sorted(self.schema.items()))
+        data = cache.load(key)
+        if data is not None:
+            print(f'extracting {self.source_data} from the parse cache')
+            return data
+        data = self._extract()
+        cache.save(key, data)
+        return data
+
+    def frame_bytes(self, data):
+        # memory held by a frame, strings included, only measured when profiling as it walks every string
+        if self.profiler.mode is None:
+            return None
+        return int(data.memory_usage(index=True, deep=True).sum())
+
+    def prefetch(self, executor):
+        # starts extracting the source on a thread of executor so it overlaps whatever runs before etl,
+        # the extract stage then only times the wait for it
+        self.prefetched = executor.submit(self._cached_extract)
+
+    def _timed_extract(self):
+        with self.profiler.stage('extract') as stage:
+            if self.prefetched is not None:
+                raw, self.prefetched = self.prefetched.result(), None
+            else:
+                raw = self._cached_extract()
+            stage['rows'] = len(raw)
+        self.profiler.note('extract', 'bytes', self.frame_bytes(raw))
+        return raw
+
+    def _chunk_dtypes(self):
+        # a first pass over the source so every chunk gets the dtypes a whole read would infer,
+        # otherwise a column that is empty in one chunk comes out as floats there and as text elsewhere
+        dtypes = dict()
+        try:
+            for chunk in self._extract_chunks():
+                for col, dtype in chunk.dtypes.items():
+                    dtypes[col] = common_dtype(dtypes.get(col, dtype), dtype)
+        except SchemaMismatch as error:
+            self._fall_back(error)
+            return self._chunk_dtypes()
+        return dtypes
     
-    def _transform(self):
+    def _apply(self, transformation):
+        with self.profiler.stage(transformation.__name__) as stage:
+            result = transformation()
+            stage['rows'] = len(self.data)
+        if not transformation.filters and set(result) != set(transformation.outputs):
+            raise ValueError(f'{transformation.__name__} returned {sorted(result)} but declares {sorted(transformation.outputs)}')
+        return result
+
+    def _plan(self):
         transformations = [getattr(self, method) for method in dir(self) if method.startswith('_transform_')]
-        print('transforming data')
-        for transformation in transformations:
-            print(f'    applying {transformation.__name__} to data')
-            transformation()
-        self.data = self.data[self.final_columns]
+        return plan(transformations, self.final_columns)
+
+    def _run_levels(self, levels, announce):
+        for level in levels:
+            if announce:
+                for transformation in level:
+                    print(f'    applying {transformation.__name__} to data')
+            if self.transform_workers > 1 and len(level) > 1:
+                with ThreadPoolExecutor(max_workers=self.transform_workers) as pool:
+                    results = list(pool.map(self._apply, level))
+            else:
+                results = [self._apply(transformation) for transformation in level]
+            for result in results:
+                for col, values in result.items():
+                    if isinstance(values, str):
+                        # a constant column is kept as a single category until it is written
+                        values = pd.Categorical.from_codes(np.zeros(len(self.data), dtype='int8'), [values])
+                    self.data[col] = values
+
+    def _shared_transform(self, announce=True):
+        # transforms return their columns and are run in the order their declared inputs and outputs need,
+        # all but the per format ones, data keeps the final columns they don't make and the columns they read
+        filters, levels, per_format, skipped = self._plan()
+        if announce:
+            print('transforming data')
+            for transformation in skipped:
+                print(f'    skipping {transformation.__name__}, nothing in final_columns needs it')
+        for transformation in filters:
+            if announce:
+                print(f'    applying {transformation.__name__} to data')
+            self.data = self.data[self._apply(transformation)]
+        self._run_levels(levels, announce)
+        made = {col for level in per_format for transformation in level for col in transformation.outputs
+                    if col not in transformation.inputs}
+        read = [col for level in per_format for transformation in level for col in transformation.inputs]
+        self.data = self.data[list(dict.fromkeys([col for col in self.final_columns if col not in made] + read))]
+
+    def _format_transform(self, format, announce=True):
+        # the output in one format, the per format transforms run on a copy so data stays shared between formats
+        shared, previous = self.data, self.format
+        self.data, self.format = shared.copy(deep=False), format
+        try:
+            self._run_levels(self._plan()[2], announce)
+            return self.data[self.final_columns]
+        finally:
+            self.data, self.format = shared, previous
+
+    def _formatted(self, announce=True):
+        return {format: self._format_transform(format, announce) for format in self.formats}
+
+    def _transform(self, announce=True):
+        self._shared_transform(announce)
+        self.data = self._format_transform(self.format, announce)
+
+    def _filename(self, filename_prefix, format=None):
+        format = format or self.format
+        if format == 'sqlite':
+            # the database is replaced on every run rather than dated, so queries always find it in the same place
+            return os.getcwd()+self.end_data + filename_prefix + '.sqlite'
+        return os.getcwd()+self.end_data + filename_prefix + datetime.strftime(datetime.utcnow(),'_STAN_%d_%b.'+format)
+
+    def _side_by_side(self, calls):
+        # a single call runs on this thread, so cProfile still sees it
+        if len(calls) == 1:
+            return calls[0]()
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            for future in [pool.submit(call) for call in calls]:
+                future.result()
+
+    def _writer(self, format, filename_prefix):
+        filename = self._filename(filename_prefix, format)
+        if format == 'sqlite':
+            return WRITERS[format](filename, filename_prefix, self.indexes)
+        return WRITERS[format](filename)
+
+    def _write(self, data, format, filename_prefix):
+        filename = self._filename(filename_prefix, format)
+        if format == 'xlsx' and self.xlsx_writer == 'streaming':
+            write_xlsx(data, filename)
+        elif format == 'xlsx':
+            data.to_excel(filename, index=False)
+        elif format == 'csv': 
+            data.to_csv(filename,index=False)
+        elif format == 'parquet':
+            data.to_parquet(filename, index=False)
+        elif format == 'feather':
+            data.reset_index(drop=True).to_feather(filename)
+        elif format == 'sqlite':
+            with self._writer(format, filename_prefix) as writer:
+                writer.write(data)
     
-    def _load(self, filename_prefix):
+    def _load(self, filename_prefix, outputs=None):
+        # outputs maps formats to their frames and are written side by side, without them data is written in format
         print('loading data')
-        filename = os.getcwd()+self.end_data + filename_prefix + datetime.strftime(datetime.utcnow(),'_STAN_%d_%b.'+self.format)
-        if self.format == 'xlsx':
-            self.data.to_excel(filename, index=False)
-        elif self.format == 'csv': 
-            self.data.to_csv(filename,index=False)
+        outputs = outputs or {self.format: self.data}
+        self._side_by_side([partial(self._write, data, format, filename_prefix)
+                                for format, data in outputs.items()])
+
+    def column(self, col):
+        # a column as plain values, categoricals are expanded to the strings they stand for
+        values = self.data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+        return values
+
+    def text(self, col):
+        # same text an f-string would give for each value, missing values become 'nan'
+        return self.column(col).astype(str).fillna('nan')
+
+    def upper(self, col, na=''):
+        return self.column(col).str.upper().fillna(na)
+
+    def concat(self, *parts):
+        # parts are literal strings or string columns, joined element-wise
+        result = ''
+        for part in parts:
+            result = result + part
+        return result
+
+    def join(self, table):
+        # the row of table (indexed by key columns of data) matching each row, looked up once per table and etl
+        # rows with no match are handled by the unmatched policy
+        if id(table) not in self.join_cache:
+            keys = pd.MultiIndex.from_frame(self.data[list(table.index.names)])
+            unmatched = ~keys.isin(table.index)
+            if unmatched.any() and self.unmatched == 'raise':
+                first = ' '.join(f'{name} {value}' for name, value in zip(keys.names, keys[unmatched][0]))
+                raise KeyError(f'{unmatched.sum()} rows of {self.source_data} have no match, the first is {first}')
+            rows = table.reindex(keys).set_axis(self.data.index)
+            if unmatched.any() and self.unmatched == 'drop':
+                print(f'    dropping {unmatched.sum()} rows with no match')
+                self.data = self.data[~unmatched]
+            elif unmatched.any():
+                rows = rows.fillna('')
+            self.join_cache[id(table)] = rows
+        return self.join_cache[id(table)].reindex(self.data.index)
+
+    def lookup(self, table, col):
+        return self.join(table)[col]
+
+    def parse_dates(self, col, format, aliases=None):
+        # each source column is parsed once, later transforms reuse the cached result
+        key = (col, format, tuple(sorted((aliases or dict()).items())))
+        if key not in self.date_cache:
+            raw = self.data[col].dropna()
+            if pd.api.types.is_numeric_dtype(raw):
+                raw = raw.astype('int64').astype(str)
+            if aliases:
+                raw = raw.replace(aliases)
+            self.date_cache[key] = pd.to_datetime(raw, format=format).reindex(self.data[col].index)
+        return self.date_cache[key].reindex(self.data.index)
+
+    def format_dates(self, col, format, out_format, aliases=None, na=np.nan):
+        key = (col, format, tuple(sorted((aliases or dict()).items())), out_format)
+        if key not in self.date_cache:
+            dates = self.parse_dates(col, format, aliases)
+            formatted = {date: date.strftime(out_format) for date in dates.dropna().unique()}
+            self.date_cache[key] = dates.map(formatted).astype(object)
+        return self.date_cache[key].reindex(self.data.index).fillna(na)
 
     def date_formula(self, col):
         if self.format == 'xlsx':
@@ -36,8 +361,123 @@ class Transformer():
         else:
             return col
 
-    def etl(self, filename_prefix):
-        self.data = self._extract()
-        self._transform()
-        self._load(filename_prefix)
+    def text_dates(self, col, format, out_format=None, aliases=None, na=np.nan):
+        # Text_* date columns, typed dates for columnar formats and text otherwise
+        # without an out_format the text is the raw column as it came from the source
+        if self.format in COLUMNAR_FORMATS:
+            return self.parse_dates(col, format, aliases)
+        if out_format is None:
+            return self.date_formula(self.data[col])
+        return self.date_formula(self.format_dates(col, format, out_format, aliases, na))
+
+    def _delta_frame(self, data):
+        # what a row's output depends on, compared between runs to find changed rows
+        return data
+
+    def _link_frame(self, data):
+        # the application, product and name of each output row for the cross-book link table, None leaves the source out
+        return None
+
+    def _save_links(self, filename_prefix, frames):
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return
+        os.makedirs(self.links_path, exist_ok=True)
+        path = os.path.join(self.links_path, filename_prefix + '.pkl')
+        pd.concat(frames, ignore_index=True).to_pickle(path + '.part')
+        os.replace(path + '.part', path)
+
+    def _incremental_transform(self, raw, filename_prefix):
+        # only rows whose keys were added or changed since the last snapshot are transformed,
+        # the rest of the output is reused from the previous run
+        os.makedirs(self.snapshot_path, exist_ok=True)
+        # the snapshot holds the output before the per format transforms, so it serves every format
+        snapshot = os.path.join(self.snapshot_path, filename_prefix)
+        current = self._delta_frame(raw)
+        # written before transforming, transforms add their columns to raw in place
+        current.to_pickle(snapshot+'.raw.pkl.part')
+        if not (os.path.exists(snapshot+'.raw.pkl') and os.path.exists(snapshot+'.out.pkl')):
+            print('    no snapshot from a previous run, transforming all rows')
+            self.data = raw
+            self._shared_transform()
+        else:
+            # output rows are indexed by their position in the raw data, kept rows are moved to their new positions
+            previous_raw = pd.read_pickle(snapshot+'.raw.pkl')
+            added, changed, removed = delta.diff(current, previous_raw, self.keys)
+            previous = pd.read_pickle(snapshot+'.out.pkl')
+            kept = previous[~delta.key_index(previous, self.keys).isin(changed.append(removed))]
+            kept.index = delta.moved_positions(kept, previous_raw, current, self.keys)
+            print(f'    {len(added)} keys added, {len(changed)} changed, {len(removed)} removed')
+            if len(added) + len(changed) == 0:
+                self.data = kept
+            else:
+                self.data = raw[delta.key_index(raw, self.keys).isin(added.append(changed))]
+                self._shared_transform()
+                self.data = pd.concat([kept, self.data]).sort_index()
+                # the caches hold the transformed rows only, the per format transforms run on all of them
+                self.date_cache = dict()
+                self.join_cache = dict()
+            unchanged = len(delta.key_index(kept, self.keys).unique())
+            delta.write_report(snapshot+'.changes.json', added, changed, removed, unchanged)
+        self.data.to_pickle(snapshot+'.out.pkl')
+        os.replace(snapshot+'.raw.pkl.part', snapshot+'.raw.pkl')
+
+    def _chunked_etl(self, filename_prefix):
+        # extract, transform and load a chunk at a time so only one chunk's columns are in memory,
+        # xlsx always goes through the streaming writer here
+        print(f'extracting {self.source_data} in chunks of {self.chunksize} rows')
+        with self.profiler.stage('extract dtypes'):
+            dtypes = self._chunk_dtypes()
+        chunks = self._extract_chunks(self.source_dtypes(dtypes))
+        links = []
+        with ExitStack() as stack:
+            writers = {format: stack.enter_context(self._writer(format, filename_prefix))
+                        for format in self.formats}
+            for number in itertools.count():
+                with self.profiler.stage('extract') as stage:
+                    chunk = next(chunks, None)
+                    stage['rows'] = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    break
+                self.profiler.note('extract', 'bytes', self.frame_bytes(chunk))
+                print(f'    chunk {number+1}: {len(chunk)} rows')
+                self.date_cache = dict()
+                self.join_cache = dict()
+                self.data = chunk
+                self._shared_transform(announce=number == 0)
+                outputs = self._formatted(announce=number == 0)
+                with self.profiler.stage('load') as stage:
+                    self._side_by_side([partial(writers[format].write, data) for format, data in outputs.items()])
+                    stage['rows'] = len(self.data)
+                self.data = outputs[self.format]
+                self.profiler.note('load', 'bytes', self.frame_bytes(self.data))
+                links.append(self._link_frame(self.data))
+        self._save_links(filename_prefix, links)
 
+    def etl(self, filename_prefix, incremental=False, profile=None, transformed=None):
+        # incremental runs need natural keys and the whole source, they take precedence over chunking
+        # profile is None, 'timings' for a JSON report of every stage or 'cprofile' to add cProfile stats
+        # transformed is called with the transformer once data holds every shared column, before the per format
+        # transforms and the load, so work that only needs those columns can start early. Chunked runs never call it
+        self.date_cache = dict()
+        self.join_cache = dict()
+        self.profiler = Profiler(filename_prefix, profile)
+        with self.profiler.run(source=str(self.source_data), formats=self.formats,
+                                incremental=bool(incremental and self.keys), chunksize=self.chunksize):
+            if incremental and self.keys:
+                self._incremental_transform(self._timed_extract(), filename_prefix)
+            elif self.chunksize:
+                self._chunked_etl(filename_prefix)
+                return
+            else:
+                self.data = self._timed_extract()
+                self._shared_transform()
+            if transformed is not None:
+                transformed(self)
+            outputs = self._formatted()
+            with self.profiler.stage('load') as stage:
+                self._load(filename_prefix, outputs)
+                stage['rows'] = len(self.data)
+            self.data = outputs[self.format]
+            self.profiler.note('load', 'bytes', self.frame_bytes(self.data))
+            self._save_links(filename_prefix, [self._link_frame(self.data)])
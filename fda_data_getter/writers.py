@@ -0,0 +1,120 @@
+'''
+Output writers that take a DataFrame a chunk at a time, for transformers that run in chunks.
+Each one produces the same file the matching whole-DataFrame call in Transformer._load would.
+'''
+
+import os
+import sqlite3
+import pandas as pd
+from .xlsx import XlsxWriter
+
+class CsvWriter():
+    def __init__(self, filename):
+        self.file = open(filename, 'w', newline='')
+        self.header = True
+
+    def write(self, data):
+        data.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ArrowWriter():
+    # every chunk is cast to the schema of the first one so a column that is all missing in one chunk still lines up.
+    # opener(filename, schema) makes the pyarrow writer once that schema is known
+    def __init__(self, filename, opener):
+        self.filename = filename
+        self.opener = opener
+        self.schema = None
+        self.writer = None
+
+    def write(self, data):
+        import pyarrow as pa
+        if self.schema is None:
+            self.schema = pa.Schema.from_pandas(data, preserve_index=False)
+            self.writer = self.opener(self.filename, self.schema)
+        self.writer.write_table(pa.Table.from_pandas(data, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def parquet_file(filename, schema):
+    import pyarrow.parquet as pq
+    return pq.ParquetWriter(filename, schema)
+
+def feather_file(filename, schema):
+    # feather v2 is the arrow ipc file format, compressed with lz4 like DataFrame.to_feather
+    import pyarrow as pa
+    return pa.ipc.new_file(filename, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+class ParquetWriter(ArrowWriter):
+    def __init__(self, filename):
+        super().__init__(filename, parquet_file)
+
+class FeatherWriter(ArrowWriter):
+    def __init__(self, filename):
+        super().__init__(filename, feather_file)
+
+class SqliteWriter():
+    # a book's table in a database file of its own, so books running side by side never wait on each other's lock.
+    # rows go to a temporary file in bulk and the indexes are built once they are all in, the file is only swapped in
+    # on a clean close so a query never sees a half written table
+    def __init__(self, filename, table, indexes=()):
+        self.filename = filename
+        self.table = table
+        self.indexes = indexes
+        self.written = False
+        if os.path.exists(filename+'.part'):
+            os.remove(filename+'.part')
+        self.connection = sqlite3.connect(filename+'.part', check_same_thread=False)
+        # chunks come from the load threads one at a time, and a fresh file that is thrown away on failure needs no journal
+        self.connection.execute('PRAGMA journal_mode=OFF')
+        self.connection.execute('PRAGMA synchronous=OFF')
+
+    def write(self, data):
+        plain = data.astype({col: object for col in data.columns if isinstance(data[col].dtype, pd.CategoricalDtype)})
+        plain.to_sql(self.table, self.connection, if_exists='append', index=False, chunksize=50000)
+        self.written = True
+
+    def close(self):
+        if self.written:
+            for columns in self.indexes:
+                name = '_'.join([self.table, *columns])
+                self.connection.execute(f'CREATE INDEX {quote(name)} ON {quote(self.table)} '
+                                        f'({", ".join(map(quote, columns))})')
+        self.connection.commit()
+        self.connection.close()
+        os.replace(self.filename+'.part', self.filename)
+
+    def discard(self):
+        self.connection.close()
+        os.remove(self.filename+'.part')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+def quote(name):
+    # an sqlite identifier, the column names have spaces, # and ; in them
+    return '"' + name.replace('"', '""') + '"'
+
+WRITERS = {'xlsx': XlsxWriter, 'csv': CsvWriter, 'parquet': ParquetWriter, 'feather': FeatherWriter, 'sqlite': SqliteWriter}
@@ -0,0 +1,159 @@
+'''
+Streaming xlsx writer.
+The sheet xml is built a chunk of rows at a time with column-wise string operations and
+streamed straight into the zip, so memory stays flat however long the sheet is and no
+per-cell python objects are created. The workbook matches what DataFrame.to_excel writes
+with index=False: one sheet named Sheet1, a plain header row, numbers as numbers,
+strings starting with = as formulas and missing values as empty cells.
+'''
+
+import zipfile
+from numbers import Number
+import numpy as np
+import pandas as pd
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>')
+
+ROOT_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>')
+
+WORKBOOK = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+    '<calcPr fullCalcOnLoad="1"/></workbook>')
+
+WORKBOOK_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>')
+
+STYLES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>')
+
+SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+
+SHEET_END = '</sheetData></worksheet>'
+
+# characters xml 1.0 does not allow, Excel drops them as well
+ILLEGAL_CHARACTERS = r'[\x00-\x08\x0b\x0c\x0e-\x1f]'
+
+def column_letter(number):
+    letters = ''
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def escape(text):
+    text = text.str.replace('&', '&amp;', regex=False).str.replace('<', '&lt;', regex=False)
+    text = text.str.replace('>', '&gt;', regex=False)
+    return text.str.replace(ILLEGAL_CHARACTERS, '', regex=True)
+
+def string_cells(values, refs):
+    text = escape(values.astype(str))
+    formula = text.str.startswith('=')
+    cells = refs + ' t="inlineStr"><is><t xml:space="preserve">' + text + '</t></is></c>'
+    cells = cells.where(~formula, refs + '><f>' + text.str[1:] + '</f></c>')
+    # openpyxl leaves empty strings as empty cells
+    return cells.where(text != '', '')
+
+def number_cells(values, refs):
+    return refs + '><v>' + values.astype(str) + '</v></c>'
+
+def bool_cells(values, refs):
+    return refs + ' t="b"><v>' + values.astype(int).astype(str) + '</v></c>'
+
+def column_cells(values, refs):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # categories are written as the values they stand for
+        values = values.astype(object)
+    present = values.notna()
+    cells = pd.Series('', index=values.index, dtype=object)
+    if not present.any():
+        return cells
+    values, refs = values[present], refs[present]
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if pd.api.types.is_bool_dtype(values) or kind == 'boolean':
+        cells[present] = bool_cells(values, refs)
+    elif pd.api.types.is_numeric_dtype(values) or kind in ('integer', 'floating', 'mixed-integer-float'):
+        cells[present] = number_cells(values, refs)
+    elif kind in ('string', 'empty'):
+        cells[present] = string_cells(values, refs)
+    else:
+        # mixed numbers and text, keep each value's own type like openpyxl does
+        bools = values.map(lambda value: isinstance(value, (bool, np.bool_)))
+        numbers = values.map(lambda value: isinstance(value, Number)) & ~bools
+        mixed = string_cells(values, refs)
+        mixed[numbers] = number_cells(values[numbers], refs[numbers])
+        mixed[bools] = bool_cells(values[bools], refs[bools])
+        cells[present] = mixed
+    return cells
+
+def sheet_rows(data, first_row):
+    data = data.reset_index(drop=True)
+    row_numbers = pd.Series(range(first_row, first_row + len(data))).astype(str)
+    rows = '<row r="' + row_numbers + '">'
+    for position, column in enumerate(data.columns):
+        refs = '<c r="' + column_letter(position) + row_numbers + '"'
+        rows = rows + column_cells(data.iloc[:, position], refs)
+    return ''.join(rows + '</row>')
+
+class XlsxWriter():
+    # writes a sheet a DataFrame at a time, the header comes from the first one written
+    def __init__(self, filename, chunksize=2000, compresslevel=6):
+        # chunksize bounds memory, a lower compresslevel trades file size for speed
+        self.chunksize = chunksize
+        self.next_row = 1
+        self.archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self.archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        self.archive.writestr('_rels/.rels', ROOT_RELS)
+        self.archive.writestr('xl/workbook.xml', WORKBOOK)
+        self.archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        self.archive.writestr('xl/styles.xml', STYLES)
+        self.sheet = self.archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self.sheet.write(SHEET_START.encode('utf-8'))
+
+    def write(self, data):
+        if self.next_row == 1:
+            header = pd.DataFrame([list(map(str, data.columns))], columns=data.columns)
+            self.sheet.write(sheet_rows(header, 1).encode('utf-8'))
+            self.next_row = 2
+        for start in range(0, len(data), self.chunksize):
+            rows = data.iloc[start:start+self.chunksize]
+            self.sheet.write(sheet_rows(rows, self.next_row).encode('utf-8'))
+            self.next_row += len(rows)
+
+    def close(self):
+        self.sheet.write(SHEET_END.encode('utf-8'))
+        self.sheet.close()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_xlsx(data, filename, chunksize=2000, compresslevel=6):
+    with XlsxWriter(filename, chunksize, compresslevel) as writer:
+        writer.write(data)
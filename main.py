@@ -1,37 +1,104 @@
-from fda_data_getter.orange_book import OrangeBook
-from fda_data_getter.purple_book import PurpleBook
-from fda_data_getter.ndc import NDCBook
+from fda_data_getter.formats import FORMATS, COLUMNAR_FORMATS, UNMATCHED_POLICIES
 from time import time
-import sys
+import importlib.util
+import argparse
 import os
 
-def main(format='xlsx'):
+# the books in the order they are run, each one's module (and pandas with it) is only imported when it is run
+BOOKS = ('purple', 'ndc', 'orange')
+
+def make_books(names, format, fetcher, jobs, incremental, unmatched, profile, keep_patent_list=True, base_url=None):
+    # with base_url every source is fetched from the same path on that host instead of the FDA sites
+    from fda_data_getter.fetch import rebase
+    books = []
+    if 'purple' in names:
+        from fda_data_getter.purple_book import PurpleBook, PURPLE_BOOK_URL
+        books.append(PurpleBook(format=format, purple_book_url=rebase(PURPLE_BOOK_URL, base_url), fetcher=fetcher,
+                                profile=profile, keep_patent_list=keep_patent_list))
+    if 'ndc' in names:
+        from fda_data_getter.ndc import NDCBook, NDC_URL
+        books.append(NDCBook(ndc_url=rebase(NDC_URL, base_url), format=format, fetcher=fetcher, incremental=incremental,
+                                profile=profile))
+    if 'orange' in names:
+        from fda_data_getter.orange_book import OrangeBook, ORANGE_BOOK_URL
+        books.append(OrangeBook(orange_book_url=rebase(ORANGE_BOOK_URL, base_url), format=format, fetcher=fetcher, jobs=jobs,
+                                incremental=incremental, unmatched=unmatched, profile=profile))
+    return books
+
+def main(format='xlsx', retries=3, timeout=60, skip_unchanged=False, jobs=1, incremental=False, unmatched='raise', profile=None,
+            books=BOOKS, keep_patent_list=True, base_url=None):
+    from fda_data_getter.fetch import Fetcher, FetchCache, fetch_all
     print('\033[94mGetting fda and NDC data\033[0m')
     start = time()
-    orange_book = OrangeBook(format=format)
-    purple_book = PurpleBook(format=format)
-    ndc_book = NDCBook(format=format)
-    ops = [purple_book, ndc_book, orange_book]
-    for op in ops:
-        op.get_book()
+    fetcher = Fetcher(retries=retries, timeout=timeout, cache=FetchCache('raw_data/fetch_cache.json'))
+    ops = make_books(books, format, fetcher, jobs, incremental, unmatched, profile, keep_patent_list, base_url)
+    fetch_all(ops)
+    fetcher.close()
+    if skip_unchanged:
+        for op in ops:
+            if not op.changed:
+                print(f'{type(op).__name__} is unchanged since it was last processed, skipping')
+        ops = [op for op in ops if op.changed]
+    failed = []
+    if jobs > 1:
+        from fda_data_getter.runner import run_books
+        failed = run_books(ops, jobs)
+        fetcher.cache.mark_processed([url for op in ops if type(op).__name__ not in failed for url in op.urls])
+    else:
+        for op in ops:
+            op.process()
+            fetcher.cache.mark_processed(op.urls)
+    if ops:
+        # books that were skipped, failed or not chosen are linked with the rows they saved on their last run
+        from fda_data_getter.links import LinkBook
+        LinkBook(format=format, profile=profile).process()
     end = time()
     elapsed = round((end-start)/60,1)
-    print(f'\033[92mDone! Operation took {elapsed} minutes\033[0m')
+    if failed:
+        print(f'\033[91m{", ".join(failed)} failed, see logs/. Operation took {elapsed} minutes\033[0m')
+    else:
+        print(f'\033[92mDone! Operation took {elapsed} minutes\033[0m')
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='get the FDA books and write them to "finished data"',
+                                        epilog='e.g. \'python main.py\', \'python main.py xlsx csv\' or \'python main.py csv --books ndc\'')
+    parser.add_argument('formats', nargs='*', metavar='format',
+                        help=f'output formats, any of {", ".join(FORMATS)}, several are written from one download and transform (default xlsx)')
+    parser.add_argument('--books', nargs='+', choices=BOOKS, default=list(BOOKS),
+                        help='the books to get, the others keep their last output (default all of them)')
+    parser.add_argument('--jobs', type=int, default=1, help='books processed side by side, each in its own process')
+    parser.add_argument('--unmatched', choices=UNMATCHED_POLICIES, default='raise',
+                        help='what to do with patent and exclusivity rows whose product is not in the products file: '
+                                'raise stops the Orange Book, drop leaves them out and blank keeps them with the product\'s '
+                                'columns blank (default raise)')
+    parser.add_argument('--skip-unchanged', action='store_true', help='skip books whose downloads have not changed since they were last processed')
+    parser.add_argument('--incremental', action='store_true', help='only transform rows changed since the last snapshot')
+    parser.add_argument('--discard-patent-list', action='store_true',
+                        help='delete the Purple Book patent list\'s JSON once it is processed rather than keep it in raw_data')
+    parser.add_argument('--base-url', help='fetch every source from the same path on this host instead of the FDA sites, '
+                                            'e.g. a local mirror')
+    profiling = parser.add_mutually_exclusive_group()
+    profiling.add_argument('--profile', action='store_const', const='timings', dest='profile',
+                            help='write a JSON timing report per output file to profiles/')
+    profiling.add_argument('--cprofile', action='store_const', const='cprofile', dest='profile',
+                            help='--profile with cProfile stats as well')
+    args = parser.parse_args(args)
+    args.formats = list(dict.fromkeys(args.formats)) or ['xlsx']
+    unknown = [run_format for run_format in args.formats if run_format not in FORMATS]
+    if unknown:
+        parser.error(f'unknown format {unknown[0]}, formats must be in {", ".join(FORMATS)}')
+    columnar = [run_format for run_format in args.formats if run_format in COLUMNAR_FORMATS]
+    if columnar and importlib.util.find_spec('pyarrow') is None:
+        parser.error(f'{columnar[0]} output needs pyarrow, try \'pip install pyarrow\'')
+    args.books = [book for book in BOOKS if book in args.books]
+    return args
 
-if __name__ == '__main__': 
+if __name__ == '__main__':
+    args = parse_args()
     for dir in ['raw_data', 'finished data']:
         if not os.path.exists(dir):
             os.mkdir(dir)
-    if len(sys.argv) > 1: 
-        run_format = sys.argv[1]
-        if run_format not in ('xlsx', 'csv'):
-            print(f'arguments must be in \'xlsx\', \'csv\', \'\'\n')
-            print('try \'python main.py csv\'\n')
-            print('or \'python main.py xlsx \'\n')
-            print('or just \'python main.py\'\n')
-        else:
-            print(f'output files will be in {run_format} format')
-            main(run_format)
-    else:
-        print(f'output files will be in xlsx format')
-        main()
+    print(f'output files will be in {", ".join(args.formats)} format')
+    main(args.formats, skip_unchanged=args.skip_unchanged, jobs=args.jobs, incremental=args.incremental,
+            unmatched=args.unmatched, profile=args.profile, books=args.books, keep_patent_list=not args.discard_patent_list,
+            base_url=args.base_url)